@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'customer_interface.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,6 +68,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requests running the same SQL this many times are reported as possible N+1 queries
+QUERY_METRICS_N_PLUS_ONE_THRESHOLD = 10
+# Bearer token required by the metrics endpoint, the endpoint is disabled when empty
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 ROOT_URLCONF = 'DjangoAir.urls'
 
 TEMPLATES = [
@@ -103,6 +109,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# 'default' is a per-process local memory cache for small hot objects.
+# 'shared' is visible to all workers: Redis when REDIS_URL is set, a file based cache otherwise.
+
+REDIS_URL = config('REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'airwise-local',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+    },
+}
+
+PRICE_QUOTE_CACHE = 'shared'
+# Seconds a worker trusts the price version it has read from the shared cache
+PRICE_QUOTE_VERSION_TTL = 5
+
+# Rendered ticket PDFs, stored by a hash of their content and evicted least recently used first.
+# The limit is checked every 10 minutes by the evict-ticket-artifacts task, so it can be exceeded in between.
+TICKET_ARTIFACT_DIR = config('TICKET_ARTIFACT_DIR', default=str(BASE_DIR / 'var' / 'tickets'))
+TICKET_ARTIFACT_MAX_BYTES = config('TICKET_ARTIFACT_MAX_BYTES', default=256 * 1024 * 1024, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -153,14 +190,47 @@ EMAIL_PORT = '587'
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = True
+EMAIL_TIMEOUT = 30
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
 
+# Paid orders are delivered as one email with a multi-page PDF; False sends an email per ticket
+SEND_TICKETS_PER_ORDER = config('SEND_TICKETS_PER_ORDER', default=True, cast=bool)
+
+# WayForPay API client
+WAYFORPAY_API = config('WAYFORPAY_API', default='https://api.wayforpay.com/api')
+WAYFORPAY_TIMEOUT = (config('WAYFORPAY_CONNECT_TIMEOUT', default=3.05, cast=float),
+                     config('WAYFORPAY_READ_TIMEOUT', default=10, cast=float))
+WAYFORPAY_RETRIES = config('WAYFORPAY_RETRIES', default=3, cast=int)
+WAYFORPAY_POOL_SIZE = config('WAYFORPAY_POOL_SIZE', default=10, cast=int)
+
+# Polling of CHECK_STATUS for orders whose payment callback did not arrive
+WAYFORPAY_INVOICE_TIMEOUT = timedelta(days=1)
+WAYFORPAY_RECONCILE_AFTER = timedelta(minutes=config('WAYFORPAY_RECONCILE_AFTER_MINUTES', default=10, cast=int))
+WAYFORPAY_RECONCILE_BATCH = config('WAYFORPAY_RECONCILE_BATCH', default=200, cast=int)
+WAYFORPAY_RECONCILE_WORKERS = config('WAYFORPAY_RECONCILE_WORKERS', default=8, cast=int)
+
 CELERY_BEAT_SCHEDULE = {
     'update-tables-and-send-emails': {
         'task': 'customer_interface.tasks.update_tables_and_send_emails',
         'schedule': crontab(minute=0),
     },
+    'release-expired-ticket-holds': {
+        'task': 'customer_interface.tasks.release_expired_holds',
+        'schedule': timedelta(seconds=30),
+    },
+    'evict-ticket-artifacts': {
+        'task': 'customer_interface.tasks.evict_ticket_artifacts',
+        'schedule': timedelta(minutes=10),
+    },
+    'reconcile-payments': {
+        'task': 'customer_interface.tasks.reconcile_payments',
+        'schedule': timedelta(minutes=5),
+    },
 }
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# How long a booked ticket is kept for the user before it becomes available to other buyers
+TICKET_HOLD_TTL = timedelta(minutes=config('TICKET_HOLD_TTL_MINUTES', default=1, cast=int))
 
 CELERY_BROKER_URL = 'pyamqp://localhost'
 CELERY_RESULT_BACKEND = 'rpc://localhost'
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Airplane, Flight, Ticket, Order, Facilities, FlightFacilities, TicketFacilities
+from .models import Airplane, Flight, Ticket, Order, Facilities, FlightFacilities, TicketFacilities, TicketEvent
 
 admin.site.register(Airplane)
 admin.site.register(Order)
@@ -31,3 +31,16 @@ class TicketAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Ticket, TicketAdmin)
+
+
+class TicketEventAdmin(admin.ModelAdmin):
+    list_display = ['ticket_id', 'from_state', 'to_state', 'actor', 'created_at']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(TicketEvent, TicketEventAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CustomerInterfaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customer_interface'
+
+    def ready(self):
+        # Connects the cache invalidation receivers
+        from customer_interface.utils import cache, price_quote  # noqa: F401
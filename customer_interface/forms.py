@@ -25,15 +25,31 @@ class SearchFlightForm(forms.Form):
         required=False,
         label="",
         widget=forms.TextInput(
-            attrs={"placeholder": "Search by place of departure"}
-        )
+            attrs={"placeholder": "Place of departure starts with"}
+        ),
+        help_text="Matches the beginning of the city name, e.g. \"New\" finds New York.",
     )
     place_of_arrival = forms.CharField(
         max_length=255,
         required=False,
         label="",
         widget=forms.TextInput(
-            attrs={"placeholder": "Search by place of arrival"}
+            attrs={"placeholder": "Place of arrival starts with"}
+        ),
+        help_text="Matches the beginning of the city name, e.g. \"New\" finds New York.",
+    )
+    departure_from = forms.DateField(
+        required=False,
+        label="",
+        widget=forms.DateInput(
+            attrs={"type": "date", "placeholder": "Departure from"}
+        )
+    )
+    departure_to = forms.DateField(
+        required=False,
+        label="",
+        widget=forms.DateInput(
+            attrs={"type": "date", "placeholder": "Departure to"}
         )
     )
 
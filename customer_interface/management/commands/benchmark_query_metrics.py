@@ -0,0 +1,89 @@
+import json
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+
+from customer_interface.management.commands.benchmark_views import Command as BenchmarkViewsCommand
+from customer_interface.tasks import deliver_order_tickets
+
+METRICS_MIDDLEWARE = 'customer_interface.middleware.QueryMetricsMiddleware'
+
+
+class Command(BenchmarkViewsCommand):
+    help = ('Measures the latency overhead of QueryMetricsMiddleware on the customer_interface views '
+            'and fails when it exceeds the budget.')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(flights=300, iterations=200, output='benchmark_query_metrics.json')
+        parser.add_argument('--budget', type=float, default=1.0, help='Allowed overhead, percent.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with mock.patch.object(deliver_order_tickets, 'delay'):
+                results = self.compare(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        for name, result in results['views'].items():
+            self.stdout.write(f"{name:24} without {result['without_ms']:8.3f} ms  with {result['with_ms']:8.3f} ms  "
+                              f"overhead {result['overhead_percent']:6.2f} %")
+        total = results['overhead_percent']
+        if total > options['budget']:
+            raise CommandError(f"Overhead {total:.2f} % is over the budget of {options['budget']} %")
+        self.stdout.write(self.style.SUCCESS(f"Overhead {total:.2f} % is within the budget of {options['budget']} %"))
+
+    def compare(self, options):
+        iterations = options['iterations']
+        # Both case sets pay callbacks: warm-up plus the timed requests
+        dataset = self.seed_dataset(options, callbacks=2 * (iterations + 1))
+
+        without = [name for name in settings.MIDDLEWARE if name != METRICS_MIDDLEWARE]
+        cases_with = self.load_cases(dataset, [METRICS_MIDDLEWARE] + without)
+        cases_without = self.load_cases(dataset, without)
+
+        views = {}
+        total_with = total_without = 0
+        for name in cases_with:
+            self.stdout.write(f'Benchmarking {name}')
+            timings_with, timings_without = [], []
+            # Interleaved, so drift of the machine affects both variants alike
+            for _number in range(iterations):
+                for request, timings in ((cases_with[name], timings_with), (cases_without[name], timings_without)):
+                    started = time.perf_counter()
+                    request()
+                    timings.append((time.perf_counter() - started) * 1000)
+            median_with = statistics.median(timings_with)
+            median_without = statistics.median(timings_without)
+            total_with += median_with
+            total_without += median_without
+            views[name] = {
+                'with_ms': round(median_with, 3),
+                'without_ms': round(median_without, 3),
+                'overhead_percent': round((median_with - median_without) / median_without * 100, 2),
+            }
+
+        return {
+            'meta': {'commit': self.git_commit(), 'database': connection.vendor, 'iterations': iterations,
+                     'flights': len(dataset['flight_ids'])},
+            'views': views,
+            'overhead_percent': round((total_with - total_without) / total_without * 100, 2),
+        }
+
+    def load_cases(self, dataset, middleware):
+        """Builds the cases and sends their first request, which loads the given middleware into the clients."""
+        with override_settings(MIDDLEWARE=middleware):
+            cases = self.build_cases(dataset)
+            for request in cases.values():
+                request()
+        return cases
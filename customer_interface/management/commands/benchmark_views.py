@@ -0,0 +1,185 @@
+import json
+import random
+import subprocess
+import time
+import tracemalloc
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment, CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from customer_interface.models import Basket, Ticket
+from customer_interface.tasks import deliver_order_tickets
+from customer_interface.utils.synthetic import seed_flights, create_customer, seed_order
+from customer_interface.utils.ticket_codes import sign_ticket
+from customer_interface.utils.wayforpay import encode_order_reference
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    index = max(0, round(pct / 100 * len(ordered) + 0.5) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Seeds a synthetic dataset into a throwaway test database and records query count, p50/p95 latency '
+            'and peak memory of the customer_interface views as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=3000)
+        parser.add_argument('--fill', type=float, default=0.8, help='Share of the seats with a ticket.')
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='benchmark_views.json')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # The broker is not part of the measured request
+            with mock.patch.object(deliver_order_tickets, 'delay'):
+                results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        for name, result in results['views'].items():
+            self.stdout.write(f"{name:24} {result['queries']:5} queries  p50 {result['p50_ms']:8.2f} ms  "
+                              f"p95 {result['p95_ms']:8.2f} ms  peak {result['peak_memory_kb']:9.1f} KiB")
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_benchmark(self, options):
+        iterations = options['iterations']
+        started = time.perf_counter()
+        dataset = self.seed_dataset(options, callbacks=iterations + 3)
+        seed_seconds = time.perf_counter() - started
+
+        views = {}
+        for name, request in self.build_cases(dataset).items():
+            self.stdout.write(f'Benchmarking {name}')
+            views[name] = self.measure(request, iterations)
+
+        return {
+            'meta': {
+                'commit': self.git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'flights': len(dataset['flight_ids']),
+                'tickets': Ticket.objects.count(),
+                'iterations': iterations,
+                'seed': options['seed'],
+                'seed_seconds': round(seed_seconds, 2),
+            },
+            'views': views,
+        }
+
+    @staticmethod
+    def seed_dataset(options, callbacks):
+        """Seeds the flights, a customer with a basket and an order, a staff user and `callbacks` unpaid orders."""
+        rng = random.Random(options['seed'])
+        flight_ids = seed_flights(options['flights'], rng, options['fill'])
+
+        staff = create_customer('benchmark-staff@example.com', is_superuser=True)
+        customer = create_customer('benchmark-customer@example.com')
+        basket = Basket.objects.get(user=customer)
+        basket.tickets.add(*Ticket.objects.bulk_create([
+            Ticket(flight_id=rng.choice(flight_ids), seat_class='economy') for _number in range(3)
+        ]))
+        return {
+            'flight_ids': flight_ids,
+            'staff': staff,
+            'customer': customer,
+            'order': seed_order(customer, flight_ids, rng, tickets=3),
+            # Every callback pays a fresh order, a repeated one would only measure the idempotency check
+            'paid_orders': iter([seed_order(customer, flight_ids, rng) for _number in range(callbacks)]),
+            'ticket': Ticket.objects.filter(status='checked_out').first(),
+            'flight_id': flight_ids[len(flight_ids) // 2],
+        }
+
+    @staticmethod
+    def build_cases(dataset):
+        """
+        Requests of every benchmarked view. The clients are created here, so they load
+        the middleware of the settings active when the first request of a case is sent.
+        """
+        customer_client = Client()
+        customer_client.force_login(dataset['customer'])
+        staff_client = Client()
+        staff_client.force_login(dataset['staff'])
+        gateway_client = Client()
+        flight_id = dataset['flight_id']
+
+        def callback():
+            order = next(dataset['paid_orders'])
+            payload = json.dumps({'orderReference': encode_order_reference(order.id), 'reasonCode': 1100})
+            return gateway_client.post(reverse('customer_interface:wayforpay_callback'), {payload: ''})
+
+        return {
+            'IndexView': lambda: customer_client.get(reverse('customer_interface:home')),
+            'IndexView (search)': lambda: customer_client.get(
+                reverse('customer_interface:home'), {'place_of_departure': 'Kyiv', 'place_of_arrival': ''}),
+            'FlightDetailView': lambda: customer_client.get(
+                reverse('customer_interface:flight_detail', args=[flight_id])),
+            'basket_view': lambda: customer_client.get(reverse('customer_interface:basket')),
+            'create_order': lambda: customer_client.get(reverse('customer_interface:create_order')),
+            'ticket_customization': lambda: customer_client.get(
+                reverse('customer_interface:ticket_customization', args=[dataset['order'].id])),
+            'ticket_input (scan)': lambda: staff_client.post(
+                reverse('customer_interface:ticket_input'), {'ticket_id': sign_ticket(dataset['ticket'])}),
+            'ticket_detail': lambda: staff_client.get(
+                reverse('customer_interface:ticket_detail', args=[dataset['ticket'].id])),
+            'flight_stats': lambda: staff_client.get(reverse('customer_interface:flight_stats', args=[flight_id])),
+            'WayForPayCallback': callback,
+        }
+
+    @staticmethod
+    def measure(request, iterations):
+        """
+        Warms the caches with one request, then counts the queries of one request,
+        times `iterations` requests and traces the memory of one more.
+        The passes are separate, so query capturing and tracemalloc do not distort the latency.
+        """
+        status = request().status_code
+
+        # The query log is a bounded deque, it must not be full already when the capture starts
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            request()
+
+        timings = []
+        for _number in range(iterations):
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        try:
+            request()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': status,
+            'queries': len(queries),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,82 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from customer_interface.models import Ticket
+from customer_interface.utils.synthetic import seed_flights, create_customer, seed_order
+from customer_interface.validators import BUSY_STATUSES
+
+TICKET_TABLE = Ticket._meta.db_table
+
+
+def hot_queries(flight_id, order_id):
+    """The Ticket filters behind the booking, check-in, boarding, statistics and hold expiry paths."""
+    tickets = Ticket.objects.all()
+    return {
+        'seat snapshot': tickets.filter(flight_id=flight_id, seat_class='economy').values_list(
+            'id', 'seat_number', 'status'),
+        'sold tickets': tickets.filter(flight_id=flight_id, seat_class='economy', status__in=BUSY_STATUSES),
+        'available ticket claim': tickets.filter(flight_id=flight_id, seat_class='business', status='available'),
+        'flight stats': tickets.filter(flight_id=flight_id, seat_class='economy', status='checked_out'),
+        'check-in list': tickets.filter(flight_id=flight_id, status='checked_out', check_in_manager__isnull=True),
+        'boarding list': tickets.filter(flight_id=flight_id, status='checked_out', gate_manager__isnull=True),
+        'expired holds': tickets.filter(status='booked', created_at__lt=timezone.now()),
+        'order tickets': tickets.filter(order_id=order_id),
+    }
+
+
+def full_scans(plan):
+    """Lines of the plan which read the whole ticket table instead of an index."""
+    if connection.vendor == 'postgresql':
+        return [line for line in plan.splitlines() if f'Seq Scan on {TICKET_TABLE}' in line]
+    if connection.vendor == 'sqlite':
+        return [line for line in plan.splitlines()
+                if f'SCAN {TICKET_TABLE}' in line and 'INDEX' not in line]
+    raise CommandError(f'EXPLAIN checks are not implemented for {connection.vendor}')
+
+
+class Command(BaseCommand):
+    help = ('Seeds a synthetic dataset into a throwaway test database and checks with EXPLAIN '
+            'that the hot Ticket queries are answered from indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=2000)
+        parser.add_argument('--fill', type=float, default=0.8, help='Share of the seats with a ticket.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            failures = self.check_plans(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError(f"Full table scans in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes'))
+
+    def check_plans(self, options):
+        rng = random.Random(options['seed'])
+        flight_ids = seed_flights(options['flights'], rng, options['fill'])
+        order = seed_order(create_customer('explain@example.com'), flight_ids, rng)
+        # Planner statistics, so the plans are the ones of a filled production table
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        failures = []
+        for name, queryset in hot_queries(flight_ids[len(flight_ids) // 2], order.id).items():
+            plan = queryset.explain()
+            scans = full_scans(plan)
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: full scan'))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if scans or options['verbosity'] > 1:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+        return failures
@@ -0,0 +1,307 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+from django.urls import reverse
+
+from customer_interface.models import Flight, Ticket
+from customer_interface.tasks import deliver_order_tickets
+from customer_interface.utils.synthetic import seed_flights, create_customer, CITIES
+from customer_interface.utils.wayforpay import encode_order_reference
+from customer_interface.validators import BUSY_STATUSES
+
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+STEPS = ('search', 'flight', 'add_ticket', 'basket', 'create_order', 'ticket_customization', 'buy_order',
+         'callback')
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Answers every WayForPay API call with an approved invoice after the configured latency."""
+    latency = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        payload = json.dumps({'reason': 'Ok', 'reasonCode': 1100, 'invoiceUrl': 'https://example.com/pay'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FunnelStats:
+    """Latencies and outcomes of the funnel steps, shared by all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejections = defaultdict(int)
+        self.completed = 0
+
+    def record(self, step, milliseconds, error=False, rejected=False):
+        with self.lock:
+            self.latencies[step].append(milliseconds)
+            if error:
+                self.errors[step] += 1
+            if rejected:
+                self.rejections[step] += 1
+
+    def complete(self):
+        with self.lock:
+            self.completed += 1
+
+    def report(self, seconds):
+        requests_count = sum(len(latencies) for latencies in self.latencies.values())
+        errors_count = sum(self.errors.values())
+        steps = {}
+        for step in STEPS:
+            latencies = sorted(self.latencies[step])
+            if not latencies:
+                continue
+            histogram = {}
+            for bound in BUCKETS:
+                histogram[f'le_{bound:g}ms'] = sum(1 for latency in latencies if latency <= bound)
+            steps[step] = {
+                'requests': len(latencies),
+                'errors': self.errors[step],
+                'rejections': self.rejections[step],
+                'p50_ms': round(latencies[len(latencies) // 2], 2),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+                'max_ms': round(latencies[-1], 2),
+                'histogram': histogram,
+            }
+        return {
+            'seconds': round(seconds, 2),
+            'requests': requests_count,
+            'requests_per_second': round(requests_count / seconds, 2),
+            'completed_funnels': self.completed,
+            'funnels_per_second': round(self.completed / seconds, 2),
+            'error_rate': round(errors_count / requests_count, 4) if requests_count else 0,
+            'steps': steps,
+        }
+
+
+class VirtualUser:
+    """One customer going through search, booking, customization, payment and the gateway callback."""
+
+    def __init__(self, base_url, user, flight_ids, stats, rng):
+        self.base_url = base_url
+        self.flight_ids = flight_ids
+        self.stats = stats
+        self.rng = rng
+        self.session = requests.Session()
+        self.session.cookies.set(settings.SESSION_COOKIE_NAME, self.login(user))
+
+    @staticmethod
+    def login(user):
+        """Creates an authenticated session directly, password hashing is not part of the funnel."""
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def request(self, step, method, url, rejected=None, **kwargs):
+        """
+        Sends the request and records its latency.
+        `rejected` tells a business refusal (full flight, busy seat) apart from a successful answer.
+        """
+        if method == 'post' and url.startswith(self.base_url):
+            kwargs.setdefault('headers', {})['X-CSRFToken'] = self.session.cookies.get('csrftoken', '')
+        started = time.perf_counter()
+        try:
+            response = getattr(self.session, method)(url, allow_redirects=False, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.stats.record(step, (time.perf_counter() - started) * 1000, error=True)
+            return None
+        milliseconds = (time.perf_counter() - started) * 1000
+        error = response.status_code >= 400
+        is_rejected = not error and rejected is not None and rejected(response)
+        self.stats.record(step, milliseconds, error=error, rejected=is_rejected)
+        return None if error or is_rejected else response
+
+    def url(self, name, *args):
+        return self.base_url + reverse(f'customer_interface:{name}', args=args)
+
+    def run(self):
+        flight_id = self.rng.choice(self.flight_ids)
+        seat_class = self.rng.choice(('economy', 'business'))
+
+        if not self.request('search', 'get', self.url('home'),
+                            params={'place_of_departure': self.rng.choice(CITIES)}):
+            return
+        if not self.request('flight', 'get', self.url('flight_detail', flight_id)):
+            return
+        # The view answers 200 with an error message when the class is sold out and redirects on success
+        if not self.request('add_ticket', 'post', self.url('flight_detail', flight_id),
+                            data={f'add_{seat_class}': ''}, rejected=lambda response: response.status_code == 200):
+            return
+        if not self.request('basket', 'get', self.url('basket')):
+            return
+
+        page = self.request('create_order', 'get', self.url('create_order'))
+        if not page:
+            return
+        ticket_ids = re.findall(r'name="ticket_(\d+)"', page.text)
+        response = self.request('create_order', 'post', self.url('create_order'),
+                                data={'create_order': '', **{f'ticket_{ticket_id}': 'on' for ticket_id in ticket_ids}},
+                                rejected=lambda response: response.status_code != 302)
+        if not response:
+            return
+        order_id = int(re.search(r'/(\d+)/?$', response.headers['Location']).group(1))
+
+        # A random seat can be taken by a concurrent user, the view then redirects back to the form.
+        # Seats up to 25 exist in both classes, so the seat class of the tickets does not matter.
+        for _attempt in range(3):
+            data = {}
+            for ticket_id in ticket_ids:
+                data[f'seat_number_{ticket_id}'] = self.rng.randint(1, 25)
+                data[f'first_name_{ticket_id}'] = 'Load'
+                data[f'last_name_{ticket_id}'] = 'Test'
+            response = self.request('ticket_customization', 'post', self.url('ticket_customization', order_id),
+                                    data=data, rejected=lambda response: response.headers.get('Location') != reverse(
+                                        'customer_interface:buy_order', args=[order_id]))
+            if response:
+                break
+        else:
+            return
+
+        if not self.request('buy_order', 'post', self.url('buy_order', order_id)):
+            return
+        # The gateway calls back without the customer's session
+        payload = json.dumps({'orderReference': encode_order_reference(order_id), 'reasonCode': 1100})
+        started = time.perf_counter()
+        try:
+            response = requests.post(self.url('wayforpay_callback'), data={payload: ''}, timeout=30)
+            self.stats.record('callback', (time.perf_counter() - started) * 1000, error=response.status_code >= 400)
+        except requests.RequestException:
+            self.stats.record('callback', (time.perf_counter() - started) * 1000, error=True)
+            return
+        self.stats.complete()
+
+
+def oversell_report():
+    """Sold tickets over the class capacity, and seats sold to more than one ticket."""
+    capacity = {}
+    for flight_id, economy, business in Flight.objects.values_list(
+            'id', 'available_economy_seats', 'available_business_seats'):
+        capacity[(flight_id, 'economy')] = economy
+        capacity[(flight_id, 'business')] = business
+
+    over_capacity = 0
+    sold = Ticket.objects.filter(status__in=BUSY_STATUSES).values('flight_id', 'seat_class').annotate(
+        count=Count('id'))
+    for row in sold:
+        over_capacity += max(0, row['count'] - capacity[(row['flight_id'], row['seat_class'])])
+
+    double_booked = Ticket.objects.filter(status__in=BUSY_STATUSES, seat_number__isnull=False).values(
+        'flight_id', 'seat_class', 'seat_number').annotate(count=Count('id')).filter(count__gt=1)
+    double_booked_seats = sum(row['count'] - 1 for row in double_booked)
+
+    return {
+        'over_capacity': over_capacity,
+        'double_booked_seats': double_booked_seats,
+        'oversold': over_capacity + double_booked_seats,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Runs virtual users through the booking funnel against a live server on a throwaway test database '
+            'with a stubbed WayForPay gateway, and reports throughput, errors, oversells and step latencies.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users.')
+        parser.add_argument('--funnels', type=int, default=5, help='Funnel runs per virtual user.')
+        parser.add_argument('--flights', type=int, default=10)
+        parser.add_argument('--fill', type=float, default=0.5, help='Share of the seats sold before the run.')
+        parser.add_argument('--gateway-latency', type=float, default=0.05, help='Stub gateway latency, seconds.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the report as JSON to this file.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        gateway = ThreadingHTTPServer(('127.0.0.1', 0), type(
+            'Gateway', (StubGatewayHandler,), {'latency': options['gateway_latency']}))
+        threading.Thread(target=gateway.serve_forever, daemon=True).start()
+        server = LiveServerThread('127.0.0.1', _StaticFilesHandler)
+        server.daemon = True
+        try:
+            server.start()
+            server.is_ready.wait()
+            if server.error:
+                raise CommandError(f'Live server failed to start: {server.error}')
+            with override_settings(WAYFORPAY_API=f'http://127.0.0.1:{gateway.server_port}/api',
+                                   ALLOWED_HOSTS=['127.0.0.1']), \
+                    mock.patch.object(deliver_order_tickets, 'delay'):
+                report = self.run_load(f'http://127.0.0.1:{server.port}', options)
+        finally:
+            server.terminate()
+            gateway.shutdown()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        self.print_report(report)
+
+    def run_load(self, base_url, options):
+        rng = random.Random(options['seed'])
+        flight_ids = seed_flights(options['flights'], rng, options['fill'])
+        stats = FunnelStats()
+        virtual_users = [
+            VirtualUser(base_url, create_customer(f'loadtest-{number}@example.com'), flight_ids, stats,
+                        random.Random(rng.random()))
+            for number in range(options['users'])
+        ]
+
+        def run_funnels(virtual_user):
+            for _number in range(options['funnels']):
+                virtual_user.run()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['users']) as executor:
+            list(executor.map(run_funnels, virtual_users))
+        report = stats.report(time.perf_counter() - started)
+        report['oversell'] = oversell_report()
+        report['options'] = {key: options[key] for key in ('users', 'funnels', 'flights', 'fill', 'gateway_latency',
+                                                           'seed')}
+        report['database'] = connection.vendor
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(f"{report['completed_funnels']} funnels in {report['seconds']} s: "
+                          f"{report['requests_per_second']} req/s, {report['funnels_per_second']} funnels/s, "
+                          f"error rate {report['error_rate']:.2%}")
+        for step, result in report['steps'].items():
+            self.stdout.write(f"{step:22} {result['requests']:6} req  {result['errors']:4} err  "
+                              f"{result['rejections']:4} rejected  p50 {result['p50_ms']:8.2f} ms  "
+                              f"p95 {result['p95_ms']:8.2f} ms")
+        oversell = report['oversell']
+        style = self.style.ERROR if oversell['oversold'] else self.style.SUCCESS
+        self.stdout.write(style(f"Oversold: {oversell['oversold']} (over capacity {oversell['over_capacity']}, "
+                                f"double booked seats {oversell['double_booked_seats']})"))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customer_interface.models import Flight, SeatInventory, Ticket
+from customer_interface.signals import seat_inventory_changed
+
+SEAT_CLASSES = ('economy', 'business')
+FIELDS = ('occupied',) + SeatInventory.COUNTERS
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the seat bitmaps and counters of the seat inventories from the tickets, in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flight', type=int, nargs='*', help='Only repair these flights.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Flights repaired per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the inventories which drifted.')
+
+    def handle(self, *args, **options):
+        flights = Flight.objects.order_by('id')
+        if options['flight']:
+            flights = flights.filter(id__in=options['flight'])
+        flight_ids = list(flights.values_list('id', flat=True))
+
+        repaired = 0
+        for start in range(0, len(flight_ids), options['batch_size']):
+            repaired += self.repair(flight_ids[start:start + options['batch_size']], options['dry_run'])
+
+        action = 'would be repaired' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{repaired} seat inventories of {len(flight_ids)} flights {action}'))
+
+    def repair(self, flight_ids, dry_run):
+        """Repairs the inventories of the flights with three reads and at most two bulk writes."""
+        with transaction.atomic():
+            # Locked before the tickets are counted: concurrent changes either are counted or wait for the commit
+            inventories = {
+                (inventory.flight_id, inventory.seat_class): inventory
+                for inventory in SeatInventory.objects.select_for_update().filter(flight_id__in=flight_ids)
+            }
+
+            expected = {
+                (flight_id, seat_class): dict.fromkeys(FIELDS, 0)
+                for flight_id in flight_ids for seat_class in SEAT_CLASSES
+            }
+            tickets = Ticket.objects.filter(flight_id__in=flight_ids)
+            for row in tickets.values('flight_id', 'seat_class').annotate(**SeatInventory.counter_aggregates()):
+                expected[(row['flight_id'], row['seat_class'])].update(
+                    {counter: row[counter] for counter in SeatInventory.COUNTERS})
+            seats = tickets.filter(seat_number__isnull=False).values_list('flight_id', 'seat_class', 'seat_number')
+            for flight_id, seat_class, seat_number in seats.iterator():
+                expected[(flight_id, seat_class)]['occupied'] |= SeatInventory.seat_mask(seat_number)
+
+            to_update = []
+            to_create = []
+            for (flight_id, seat_class), values in expected.items():
+                inventory = inventories.get((flight_id, seat_class))
+                if inventory is None:
+                    to_create.append(SeatInventory(flight_id=flight_id, seat_class=seat_class, **values))
+                elif any(getattr(inventory, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(inventory, field, value)
+                    to_update.append(inventory)
+
+            if not dry_run:
+                SeatInventory.objects.bulk_update(to_update, FIELDS)
+                SeatInventory.objects.bulk_create(to_create)
+                for inventory in to_update + to_create:
+                    transaction.on_commit(lambda inventory=inventory: seat_inventory_changed.send(
+                        sender=SeatInventory, flight_id=inventory.flight_id, seat_class=inventory.seat_class))
+        return len(to_update) + len(to_create)
@@ -0,0 +1,39 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from customer_interface.utils.query_metrics import QueryCollector, query_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryMetricsMiddleware:
+    """
+    Records wall time, SQL query count and SQL time of every request per view,
+    and flags requests which run the same SQL shape QUERY_METRICS_N_PLUS_ONE_THRESHOLD times or more.
+    The aggregates are served by the metrics view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.QUERY_METRICS_N_PLUS_ONE_THRESHOLD
+
+    def __call__(self, request):
+        collector = QueryCollector(time.perf_counter)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        repeated = collector.repeated_shapes(self.threshold) if collector.count >= self.threshold else {}
+        for shape, count in repeated.items():
+            logger.warning('Possible N+1 in %s: %s queries of %s', view, count, shape)
+        query_metrics.observe(view, duration, collector.count, collector.duration, 1 if repeated else 0)
+        return response
@@ -0,0 +1,146 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:15
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Airplane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('economy_seats', models.IntegerField(validators=[django.core.validators.MinValueValidator(20), django.core.validators.MaxValueValidator(60)])),
+                ('business_seats', models.IntegerField(validators=[django.core.validators.MinValueValidator(6), django.core.validators.MaxValueValidator(25)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Basket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('messages', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Facilities',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facilities_name', models.CharField(choices=[('lunch', 'Lunch'), ('luggage', 'Luggage')], max_length=20)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Flight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_time_of_departure', models.DateTimeField()),
+                ('date_time_of_arrival', models.DateTimeField()),
+                ('place_of_departure', models.CharField(max_length=100)),
+                ('place_of_arrival', models.CharField(max_length=100)),
+                ('available_economy_seats', models.IntegerField(default=0, editable=False)),
+                ('available_business_seats', models.IntegerField(default=0, editable=False)),
+                ('price_economy_seats', models.IntegerField(default=0)),
+                ('price_business_seats', models.IntegerField(default=0)),
+                ('price_number_economy_seats', models.IntegerField(default=0)),
+                ('price_number_business_seats', models.IntegerField(default=0)),
+                ('airplane', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flights', to='customer_interface.airplane')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FlightFacilities',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('facilities', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.facilities')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.flight')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_order', models.DateTimeField(auto_now_add=True)),
+                ('price', models.IntegerField(blank=True, default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Ticket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('economy', 'Economy'), ('business', 'Business')], max_length=10)),
+                ('seat_number', models.PositiveIntegerField(blank=True, default=None, null=True)),
+                ('status', models.CharField(choices=[('booked', 'Booked'), ('available', 'Available'), ('checked_out', 'Checked out')], default='booked', max_length=20)),
+                ('first_name', models.CharField(default=None, max_length=100, null=True)),
+                ('last_name', models.CharField(default=None, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('time_check', models.DateTimeField(default=None, null=True)),
+                ('time_gate', models.DateTimeField(default=None, null=True)),
+                ('check_in_manager', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='check_tickets', to=settings.AUTH_USER_MODEL)),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.flight')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TicketFacilities',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flight_facilities', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.flightfacilities')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.ticket')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='flight_facilities',
+            field=models.ManyToManyField(through='customer_interface.TicketFacilities', to='customer_interface.flightfacilities'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='gate_manager',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='check_gate_tickets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='order',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='customer_interface.order'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='facilities',
+            field=models.ManyToManyField(through='customer_interface.FlightFacilities', to='customer_interface.facilities'),
+        ),
+        migrations.CreateModel(
+            name='FacilitiesOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_order', models.DateTimeField(auto_now_add=True)),
+                ('price', models.IntegerField(blank=True, default=0)),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer_interface.ticket')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='facilities',
+            constraint=models.UniqueConstraint(fields=('facilities_name',), name='unique_facilities_name'),
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='tickets',
+            field=models.ManyToManyField(null=True, to='customer_interface.ticket'),
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='flightfacilities',
+            constraint=models.UniqueConstraint(fields=('facilities', 'flight'), name='unique_facilities_flight'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='arrival_search',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='departure_search',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_search', 'date_time_of_departure'], name='flight_departure_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['arrival_search', 'date_time_of_departure'], name='flight_arrival_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['date_time_of_departure', 'id'], name='flight_departure_time_idx'),
+        ),
+    ]
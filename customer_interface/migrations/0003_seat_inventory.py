@@ -0,0 +1,27 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0002_flight_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(choices=[('economy', 'Economy'), ('business', 'Business')], max_length=10)),
+                ('occupied', models.BigIntegerField(default=0)),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_inventories', to='customer_interface.flight')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='seatinventory',
+            constraint=models.UniqueConstraint(fields=('flight', 'seat_class'), name='unique_flight_seat_class_inventory'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0003_seat_inventory'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(condition=models.Q(('seat_number__isnull', False)), fields=('flight', 'seat_class', 'seat_number'), name='unique_flight_seat_number'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0004_ticket_unique_seat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'created_at'], name='ticket_status_created_idx'),
+        ),
+    ]
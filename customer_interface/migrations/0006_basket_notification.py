@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0005_ticket_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BasketNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('basket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='customer_interface.basket')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0006_basket_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_reference', models.CharField(max_length=64, unique=True)),
+                ('reason_code', models.IntegerField()),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='customer_interface.order')),
+            ],
+        ),
+    ]
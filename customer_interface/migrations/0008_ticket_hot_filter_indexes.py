@@ -0,0 +1,33 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0007_processed_payment'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='ticket_status_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['flight', 'seat_class', 'status'], name='ticket_flight_class_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['flight', 'status', 'check_in_manager'], name='ticket_flight_check_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['flight', 'status', 'gate_manager'], name='ticket_flight_gate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('status', 'booked')), fields=['created_at'], name='ticket_booked_created_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+def count_tickets(apps, schema_editor):
+    """Fills the new counters of the existing inventories from the tickets."""
+    SeatInventory = apps.get_model('customer_interface', 'SeatInventory')
+    Ticket = apps.get_model('customer_interface', 'Ticket')
+    sold = models.Q(status='checked_out')
+    rows = Ticket.objects.values('flight_id', 'seat_class').annotate(
+        held=models.Count('id', filter=models.Q(status='booked')),
+        sold=models.Count('id', filter=sold),
+        checked_in=models.Count('id', filter=sold & models.Q(check_in_manager__isnull=False)),
+        boarded=models.Count('id', filter=sold & models.Q(gate_manager__isnull=False)),
+    )
+    for row in rows:
+        SeatInventory.objects.filter(flight_id=row['flight_id'], seat_class=row['seat_class']).update(
+            held=row['held'], sold=row['sold'], checked_in=row['checked_in'], boarded=row['boarded'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0008_ticket_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seatinventory',
+            name='boarded',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seatinventory',
+            name='checked_in',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seatinventory',
+            name='held',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seatinventory',
+            name='sold',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_tickets, migrations.RunPython.noop),
+    ]
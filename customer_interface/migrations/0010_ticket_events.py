@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customer_interface', '0009_seat_inventory_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_state', models.CharField(choices=[('booked', 'Booked'), ('available', 'Available'), ('checked_out', 'Checked out')], max_length=20)),
+                ('to_state', models.CharField(choices=[('booked', 'Booked'), ('available', 'Available'), ('checked_out', 'Checked out')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('ticket', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='customer_interface.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ticket', 'created_at'], name='ticket_event_ticket_idx')],
+            },
+        ),
+    ]
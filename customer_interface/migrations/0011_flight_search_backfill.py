@@ -0,0 +1,51 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+def normalize_place(value):
+    """A frozen copy of utils.flight_search.normalize_place."""
+    return ' '.join((value or '').split()).casefold()
+
+
+def fill_search_names(apps, schema_editor):
+    """Fills the normalized names of the flights saved before the search columns existed."""
+    Flight = apps.get_model('customer_interface', 'Flight')
+    flights = Flight.objects.filter(models.Q(departure_search='') | models.Q(arrival_search='')).only(
+        'id', 'place_of_departure', 'place_of_arrival')
+    batch = []
+    for flight in flights.iterator(chunk_size=2000):
+        flight.departure_search = normalize_place(flight.place_of_departure)
+        flight.arrival_search = normalize_place(flight.place_of_arrival)
+        batch.append(flight)
+        if len(batch) >= 2000:
+            Flight.objects.bulk_update(batch, ['departure_search', 'arrival_search'])
+            batch = []
+    Flight.objects.bulk_update(batch, ['departure_search', 'arrival_search'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0010_ticket_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='flight',
+            name='flight_departure_search_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='flight',
+            name='flight_arrival_search_idx',
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_search', 'date_time_of_departure'], name='flight_departure_search_idx', opclasses=['varchar_pattern_ops', 'timestamptz_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['arrival_search', 'date_time_of_departure'], name='flight_arrival_search_idx', opclasses=['varchar_pattern_ops', 'timestamptz_ops']),
+        ),
+    ]
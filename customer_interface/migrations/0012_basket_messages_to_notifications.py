@@ -0,0 +1,29 @@
+# Generated by Django 4.2.13 on 2026-10-18 04:18
+
+from django.db import migrations
+
+
+def move_messages(apps, schema_editor):
+    """Turns every pending line of the old Basket.messages text into a BasketNotification."""
+    Basket = apps.get_model('customer_interface', 'Basket')
+    BasketNotification = apps.get_model('customer_interface', 'BasketNotification')
+    BasketNotification.objects.bulk_create([
+        BasketNotification(basket_id=basket_id, message=message)
+        for basket_id, messages in Basket.objects.exclude(messages='').values_list('id', 'messages').iterator()
+        for message in messages.split('\n') if message.strip()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_interface', '0011_flight_search_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_messages, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='basket',
+            name='messages',
+        ),
+    ]
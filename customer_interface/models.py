@@ -1,12 +1,12 @@
-from datetime import timedelta
-
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from customer_interface.signals import seat_inventory_changed
+from customer_interface.utils.flight_search import normalize_place
 from customer_interface.validators import create_ticket_validator, update_ticket_validator
 
 
@@ -41,6 +41,8 @@ class Flight(models.Model):
     date_time_of_arrival = models.DateTimeField()
     place_of_departure = models.CharField(max_length=100)
     place_of_arrival = models.CharField(max_length=100)
+    departure_search = models.CharField(max_length=100, editable=False, default='')
+    arrival_search = models.CharField(max_length=100, editable=False, default='')
     airplane = models.ForeignKey(Airplane, on_delete=models.CASCADE, related_name='flights')
     facilities = models.ManyToManyField(Facilities, through="FlightFacilities")
     available_economy_seats = models.IntegerField(editable=False, default=0)
@@ -61,6 +63,22 @@ class Flight(models.Model):
             self.available_business_seats = self.airplane.business_seats
         super().clean()
 
+    def save(self, *args, **kwargs):
+        self.departure_search = normalize_place(self.place_of_departure)
+        self.arrival_search = normalize_place(self.place_of_arrival)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Prefix search on the normalized names, the pattern operator class makes LIKE 'value%' indexable
+            # under any PostgreSQL collation
+            models.Index(fields=['departure_search', 'date_time_of_departure'], name='flight_departure_search_idx',
+                         opclasses=['varchar_pattern_ops', 'timestamptz_ops']),
+            models.Index(fields=['arrival_search', 'date_time_of_departure'], name='flight_arrival_search_idx',
+                         opclasses=['varchar_pattern_ops', 'timestamptz_ops']),
+            models.Index(fields=['date_time_of_departure', 'id'], name='flight_departure_time_idx'),
+        ]
+
 
 class FlightFacilities(models.Model):
     facilities = models.ForeignKey(Facilities, on_delete=models.CASCADE)
@@ -81,7 +99,14 @@ class FlightFacilities(models.Model):
 class Basket(models.Model):
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
     tickets = models.ManyToManyField('Ticket', null=True)
-    messages = models.TextField(blank=True)
+
+    objects = models.Manager()
+
+
+class BasketNotification(models.Model):
+    basket = models.ForeignKey(Basket, on_delete=models.CASCADE, related_name='notifications')
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
     objects = models.Manager()
 
@@ -94,6 +119,16 @@ class Order(models.Model):
     objects = models.Manager()
 
 
+class ProcessedPayment(models.Model):
+    """Payment callbacks that were already applied, so a callback retried by the gateway is applied only once."""
+    order_reference = models.CharField(max_length=64, unique=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
+    reason_code = models.IntegerField()
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.Manager()
+
+
 class FacilitiesOrder(models.Model):
     ticket = models.ForeignKey('Ticket', on_delete=models.CASCADE)
     created_order = models.DateTimeField(auto_now_add=True)
@@ -127,24 +162,325 @@ class Ticket(models.Model):
 
     objects = models.Manager()
 
+    class Meta:
+        constraints = [
+            # A seat can only be taken by one ticket; tickets without a selected seat are not restricted
+            models.UniqueConstraint(fields=['flight', 'seat_class', 'seat_number'],
+                                    condition=models.Q(seat_number__isnull=False),
+                                    name='unique_flight_seat_number')
+        ]
+        indexes = [
+            # Seat availability, ticket claiming and sales counters of a flight class
+            models.Index(fields=['flight', 'seat_class', 'status'], name='ticket_flight_class_status_idx'),
+            # Check-in and boarding lists of a flight
+            models.Index(fields=['flight', 'status', 'check_in_manager'], name='ticket_flight_check_in_idx'),
+            models.Index(fields=['flight', 'status', 'gate_manager'], name='ticket_flight_gate_idx'),
+            # Used by the hold expiry sweeper, only the booked tickets are ever scanned
+            models.Index(fields=['created_at'], condition=models.Q(status='booked'), name='ticket_booked_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_seat = instance.seat_key()
+        instance._loaded_counters = instance.counter_key()
+        return instance
+
+    def seat_key(self):
+        """Returns (flight_id, seat_class, seat_number) used to keep the seat inventory in sync."""
+        seat_number = self.__dict__.get('seat_number')
+        seat_number = int(seat_number) if seat_number not in (None, '') else None
+        return self.__dict__.get('flight_id'), self.__dict__.get('seat_class'), seat_number
+
+    def counter_key(self):
+        """Returns (flight_id, seat_class, status, checked in, boarded) used to keep the seat counters in sync."""
+        return (self.__dict__.get('flight_id'), self.__dict__.get('seat_class'), self.__dict__.get('status'),
+                self.__dict__.get('check_in_manager_id') is not None, self.__dict__.get('gate_manager_id') is not None)
+
     def clean(self):
         if self._state.adding:
             create_ticket_validator(self.seat_class, self.seat_number, self.flight, Ticket)
         else:
-            update_ticket_validator(self.seat_class, self.seat_number, self.flight, Ticket)
+            update_ticket_validator(self.seat_class, self.seat_number, self.flight, Ticket, self.pk)
 
 
 @receiver(post_save, sender=Ticket)
-def schedule_deletion(sender, instance, created, **kwargs):
-    from .tasks import available_ticket
-    if instance.status == 'booked':
-        # If the object is created for the first time and the created flag is True, schedule a deletion task.
-        if created:
-            available_ticket.apply_async(args=[instance.id], countdown=60)  # Schedule a task 60 seconds after saving.
-        else:
-            # If the object has been modified, check if more than 1 minute has passed since it was created.
-            if timezone.now() - instance.created_at > timedelta(minutes=1):
-                available_ticket.apply_async(args=[instance.id])
+def update_seat_inventory(sender, instance, created, **kwargs):
+    SeatInventory.sync_tickets([instance])
+
+
+@receiver(post_save, sender=Flight)
+def create_seat_inventories(sender, instance, created, **kwargs):
+    if created:
+        SeatInventory.objects.bulk_create([SeatInventory(flight=instance, seat_class=seat_class)
+                                           for seat_class in ('economy', 'business')])
+
+
+@receiver(post_delete, sender=Ticket)
+def release_seat(sender, instance, origin=None, **kwargs):
+    # Deleting flights, one by one, as a queryset or through their airplane, deletes their inventories too
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if origin_model in (Flight, Airplane):
+        return
+    flight_id, seat_class, seat_number = getattr(instance, '_loaded_seat', None) or instance.seat_key()
+    counters = getattr(instance, '_loaded_counters', None) or instance.counter_key()
+    # A missing inventory is not rebuilt here: the delete may still remove its flight, and an inserted row
+    # would break the foreign key. The next read rebuilds it.
+    SeatInventory.apply(flight_id, seat_class,
+                        release_mask=SeatInventory.seat_mask(seat_number) if seat_number is not None else 0,
+                        counters=SeatInventory.counter_changes([(counters, None)]).get((flight_id, seat_class)),
+                        rebuild=False)
+
+
+class SeatInventory(models.Model):
+    """
+    Occupancy bitmap of one seat class on a flight: bit N - 1 is set while seat N is taken by a ticket.
+    Airplanes have at most 60 economy and 25 business seats, so the whole class fits into one BigIntegerField.
+
+    The counters hold the number of booked (held), checked out (sold), checked in and boarded tickets of the class.
+    They are changed with F() expressions in the same transaction as the tickets.
+    """
+    COUNTERS = ('held', 'sold', 'checked_in', 'boarded')
+    # Ticket columns which decide its seat and counters, read before a ticket is updated
+    TICKET_STATE = ('id', 'flight_id', 'seat_class', 'seat_number', 'status', 'check_in_manager_id', 'gate_manager_id')
+
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='seat_inventories')
+    seat_class = models.CharField(max_length=10, choices=[('economy', _('Economy')), ('business', _('Business'))])
+    occupied = models.BigIntegerField(default=0)
+    held = models.IntegerField(default=0)
+    sold = models.IntegerField(default=0)
+    checked_in = models.IntegerField(default=0)
+    boarded = models.IntegerField(default=0)
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'seat_class'], name='unique_flight_seat_class_inventory')
+        ]
+
+    @staticmethod
+    def seat_mask(seat_number):
+        return 1 << (int(seat_number) - 1)
+
+    @staticmethod
+    def counted_as(counter_key):
+        """Names of the counters a ticket in the state counter_key is counted in."""
+        _flight_id, _seat_class, status, checked_in, boarded = counter_key
+        if status == 'booked':
+            return ('held',)
+        if status == 'checked_out':
+            return ('sold',) + (('checked_in',) if checked_in else ()) + (('boarded',) if boarded else ())
+        return ()
+
+    @classmethod
+    def counter_changes(cls, changes):
+        """
+        Sums the counter deltas of ticket state changes.
+
+        Args:
+            changes: (old counter_key, new counter_key) pairs, None for a created or deleted ticket.
+
+        Returns:
+            dict: {(flight_id, seat_class): {counter: delta}} without zero deltas.
+        """
+        deltas = {}
+        for old, new in changes:
+            for key, sign in ((old, -1), (new, 1)):
+                if key is None:
+                    continue
+                counters = deltas.setdefault(key[:2], {})
+                for counter in cls.counted_as(key):
+                    counters[counter] = counters.get(counter, 0) + sign
+        return {
+            flight_class: {counter: delta for counter, delta in counters.items() if delta}
+            for flight_class, counters in deltas.items()
+        }
+
+    @classmethod
+    def rebuild(cls, flight_id, seat_class):
+        """
+        Recomputes the bitmap and the counters from the tickets of the flight.
+        The row is normally created by the Flight post_save receiver; when it is missing and two
+        writers rebuild it at once, the one whose INSERT loses the race updates the winner's row.
+        """
+        tickets = Ticket.objects.filter(flight_id=flight_id, seat_class=seat_class)
+        occupied = 0
+        for seat_number in tickets.filter(seat_number__isnull=False).values_list('seat_number', flat=True):
+            occupied |= cls.seat_mask(seat_number)
+        values = {'occupied': occupied, **cls.count(tickets)}
+        inventories = cls.objects.filter(flight_id=flight_id, seat_class=seat_class)
+        if not inventories.update(**values):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(flight_id=flight_id, seat_class=seat_class, **values)
+            except IntegrityError:
+                inventories.update(**values)
+        seat_inventory_changed.send(sender=cls, flight_id=flight_id, seat_class=seat_class)
+        return inventories.get()
+
+    @staticmethod
+    def counter_aggregates():
+        """Aggregates computing the counters from tickets, the SQL counterpart of counted_as()."""
+        sold = models.Q(status='checked_out')
+        return {
+            'held': models.Count('id', filter=models.Q(status='booked')),
+            'sold': models.Count('id', filter=sold),
+            'checked_in': models.Count('id', filter=sold & models.Q(check_in_manager__isnull=False)),
+            'boarded': models.Count('id', filter=sold & models.Q(gate_manager__isnull=False)),
+        }
+
+    @classmethod
+    def count(cls, tickets):
+        """Counter values of the tickets, computed with one aggregate query."""
+        return tickets.aggregate(**cls.counter_aggregates())
+
+    @classmethod
+    def apply(cls, flight_id, seat_class, occupy_mask=0, release_mask=0, counters=None, rebuild=True):
+        """
+        Clears the released seats, sets the occupied ones and moves the counters with one UPDATE.
+        A missing row is rebuilt from the tickets unless rebuild is False.
+        """
+        values = {counter: F(counter) + delta for counter, delta in (counters or {}).items()}
+        if occupy_mask or release_mask:
+            values['occupied'] = F('occupied').bitand(~release_mask).bitor(occupy_mask)
+        if not values:
+            return
+        updated = cls.objects.filter(flight_id=flight_id, seat_class=seat_class).update(**values)
+        if updated:
+            seat_inventory_changed.send(sender=cls, flight_id=flight_id, seat_class=seat_class)
+        elif rebuild:
+            cls.rebuild(flight_id, seat_class)
+
+    @classmethod
+    def occupy(cls, flight_id, seat_class, seat_number):
+        cls.apply(flight_id, seat_class, occupy_mask=cls.seat_mask(seat_number))
+
+    @classmethod
+    def release(cls, flight_id, seat_class, seat_number):
+        cls.apply(flight_id, seat_class, release_mask=cls.seat_mask(seat_number))
+
+    @classmethod
+    def sync_tickets(cls, tickets):
+        """
+        Applies the seat and state changes of saved tickets to the inventories, with one UPDATE per flight class.
+        Needed after bulk_update(), which does not send post_save.
+        """
+        changes = {}
+        state_changes = []
+        for ticket in tickets:
+            loaded_seat = getattr(ticket, '_loaded_seat', None)
+            current_seat = ticket.seat_key()
+            if loaded_seat != current_seat:
+                if loaded_seat and loaded_seat[2] is not None:
+                    masks = changes.setdefault(loaded_seat[:2], [0, 0])
+                    masks[1] |= cls.seat_mask(loaded_seat[2])
+                if current_seat[2] is not None:
+                    masks = changes.setdefault(current_seat[:2], [0, 0])
+                    masks[0] |= cls.seat_mask(current_seat[2])
+            ticket._loaded_seat = current_seat
+
+            loaded_counters = getattr(ticket, '_loaded_counters', None)
+            current_counters = ticket.counter_key()
+            if loaded_counters != current_counters:
+                state_changes.append((loaded_counters, current_counters))
+            ticket._loaded_counters = current_counters
+
+        counters = cls.counter_changes(state_changes)
+        for flight_class in changes.keys() | counters.keys():
+            occupy_mask, release_mask = changes.get(flight_class, (0, 0))
+            cls.apply(*flight_class, occupy_mask, release_mask, counters.get(flight_class))
+
+    @classmethod
+    def update_tickets(cls, queryset, **values):
+        """
+        Updates the tickets of the queryset with one UPDATE and moves the seats and counters accordingly.
+        The rows are locked first, so their old states are known exactly. Meant for the status,
+        check_in_manager and gate_manager columns; seat_number can only be reset to None here.
+
+        Returns:
+            list: (ticket id, previous status) of the updated tickets.
+        """
+        if values.get('seat_number', None) is not None:
+            raise ValueError('update_tickets() can only reset seat_number to None')
+        with transaction.atomic(savepoint=False):
+            rows = list(queryset.select_for_update().values_list(*cls.TICKET_STATE))
+            if not rows:
+                return []
+            # The filters of the queryset are repeated in the UPDATE as its guard
+            queryset.filter(id__in=[row[0] for row in rows]).update(**values)
+            cls.apply_ticket_rows(rows, values)
+        return [(row[0], row[4]) for row in rows]
+
+    @classmethod
+    def update_ticket(cls, row, **values):
+        """
+        Updates one ticket read earlier without a lock, with a single conditional UPDATE. Every column of
+        the row is repeated in the WHERE clause, so a ticket changed since the read is left alone.
+
+        Args:
+            row: the TICKET_STATE columns of the ticket, as the caller read them.
+
+        Returns:
+            bool: whether the ticket was updated.
+        """
+        if values.get('seat_number', None) is not None:
+            raise ValueError('update_ticket() can only reset seat_number to None')
+        with transaction.atomic(savepoint=False):
+            if not Ticket.objects.filter(**dict(zip(cls.TICKET_STATE, row))).update(**values):
+                return False
+            cls.apply_ticket_rows([row], values)
+        return True
+
+    @classmethod
+    def apply_ticket_rows(cls, rows, values):
+        """Moves the seats and counters of updated tickets from their TICKET_STATE rows and the written values."""
+        released = {}
+        state_changes = []
+        for _ticket_id, flight_id, seat_class, seat_number, status, check_in_manager_id, gate_manager_id in rows:
+            if 'seat_number' in values and seat_number is not None:
+                released[(flight_id, seat_class)] = released.get((flight_id, seat_class), 0) | cls.seat_mask(
+                    seat_number)
+            new_status = values.get('status', status)
+            new_check_in = values['check_in_manager'] if 'check_in_manager' in values else check_in_manager_id
+            new_gate = values['gate_manager'] if 'gate_manager' in values else gate_manager_id
+            state_changes.append((
+                (flight_id, seat_class, status, check_in_manager_id is not None, gate_manager_id is not None),
+                (flight_id, seat_class, new_status, new_check_in is not None, new_gate is not None),
+            ))
+        counters = cls.counter_changes(state_changes)
+        for flight_class in released.keys() | counters.keys():
+            cls.apply(*flight_class, release_mask=released.get(flight_class, 0), counters=counters.get(flight_class))
+
+    @classmethod
+    def for_flight(cls, flight):
+        """Returns the inventories of both seat classes of the flight, loaded with a single query."""
+        inventories = {inventory.seat_class: inventory for inventory in cls.objects.filter(flight=flight)}
+        for seat_class in ('economy', 'business'):
+            if seat_class not in inventories:
+                inventories[seat_class] = cls.rebuild(flight.pk, seat_class)
+            inventories[seat_class].flight = flight
+        return inventories
+
+    @property
+    def capacity(self):
+        if self.seat_class == 'economy':
+            return self.flight.available_economy_seats
+        return self.flight.available_business_seats
+
+    def is_free(self, seat_number):
+        return not self.occupied & self.seat_mask(seat_number)
+
+    def free_seats(self):
+        return {seat_number for seat_number in range(1, self.capacity + 1) if self.is_free(seat_number)}
+
+    def remaining(self):
+        """Seats which can still be booked: the capacity minus the held and sold tickets."""
+        return self.capacity - self.held - self.sold
+
+    def count_free(self):
+        all_seats = (1 << self.capacity) - 1
+        return self.capacity - bin(self.occupied & all_seats).count('1')
 
 
 class TicketFacilities(models.Model):
@@ -155,3 +491,32 @@ class TicketFacilities(models.Model):
 
     def __str__(self):
         return f"{self.flight_facilities}"
+
+
+class TicketEvent(models.Model):
+    """
+    Append-only log of ticket status changes. Events outlive their tickets, so the ticket is not a constrained key.
+    """
+    ticket = models.ForeignKey(Ticket, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events')
+    from_state = models.CharField(max_length=20, choices=Ticket.TYPE_CHOICES)
+    to_state = models.CharField(max_length=20, choices=Ticket.TYPE_CHOICES)
+    actor = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, null=True, default=None, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ticket', 'created_at'], name='ticket_event_ticket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ticket {self.ticket_id}: {self.from_state} -> {self.to_state}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ticket events are append-only')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Ticket events are append-only')
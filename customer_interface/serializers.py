@@ -6,3 +6,8 @@ class WayForPayCallbackSerializer(serializers.Serializer):
     reasonCode = serializers.CharField()
     time = serializers.CharField()
     signature = serializers.CharField()
+
+
+class BoardingSerializer(serializers.Serializer):
+    # Scanned QR payloads
+    tickets = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=1000)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent with flight_id and seat_class whenever the seat bitmap of a flight class changes
+seat_inventory_changed = Signal()
@@ -1,24 +1,83 @@
+import logging
+
 from celery import shared_task
-from django.core.exceptions import ObjectDoesNotExist
-from django.utils.timezone import timedelta
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
 from django.utils import timezone
-from customer_interface.models import Ticket
-from customer_interface.utils.send_tickets import send_ticket_email
+from customer_interface.models import Ticket, Order
+from customer_interface.utils.mailer import RETRY_EXCEPTIONS, DeliveryFailed
+from customer_interface.utils.payments import reconcile_pending_orders
+from customer_interface.utils.send_tickets import send_ticket_email, send_ticket_emails, send_order_tickets_email
+from customer_interface.utils.ticket_artifacts import evict_artifacts
+from customer_interface.utils.ticket_states import transition_many
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
-def available_ticket(instance_id):
-    """Deleting a ticket if the time limit has expired."""
-    try:
-        obj = Ticket.objects.get(id=instance_id)
-        if obj.status == 'booked' and timezone.now() - obj.created_at > timedelta(minutes=1):
-            obj.status = 'available'
-            obj.save()
-    except ObjectDoesNotExist:
-        pass
+def release_expired_holds():
+    """Making all booked tickets whose hold time has expired available with a single UPDATE."""
+    expired_before = timezone.now() - settings.TICKET_HOLD_TTL
+    released = len(transition_many(
+        Ticket.objects.filter(status='booked', created_at__lt=expired_before).values('id'), 'booked', 'available'
+    ))
+    logger.info('Released %s expired ticket holds', released)
+    return released
+
+
+@shared_task
+def evict_ticket_artifacts():
+    """Removing the least recently used ticket PDFs once the artifact cache is over its size limit."""
+    removed = evict_artifacts()
+    logger.info('Evicted %s ticket artifacts', removed)
+    return removed
 
 
 @shared_task
+def reconcile_payments():
+    """Checking out orders whose payment callback never arrived, by polling the gateway."""
+    paid = reconcile_pending_orders()
+    logger.info('Reconciled %s paid orders', paid)
+    return paid
+
+
+@shared_task(autoretry_for=RETRY_EXCEPTIONS, retry_backoff=True, retry_jitter=True, max_retries=5)
 def send_tickets(ticket_id, email):
-    ticket = Ticket.objects.get(pk=ticket_id)
+    ticket = Ticket.objects.select_related('flight').prefetch_related('flight_facilities__facilities').get(pk=ticket_id)
     send_ticket_email(ticket, email)
+
+
+@shared_task(bind=True, autoretry_for=RETRY_EXCEPTIONS, retry_backoff=True, retry_jitter=True, max_retries=5)
+def send_ticket_batch(self, ticket_ids, email):
+    """Sending an email per ticket over one connection. A retry only sends the tickets which were not sent."""
+    tickets = list(Ticket.objects.filter(id__in=ticket_ids).select_related('flight').prefetch_related(
+        'flight_facilities__facilities'
+    ))
+    try:
+        send_ticket_emails(tickets, email)
+    except DeliveryFailed as error:
+        unsent = [ticket.id for ticket in tickets[len(tickets) - len(error.unsent):]]
+        countdown = get_exponential_backoff_interval(factor=1, retries=self.request.retries, maximum=600,
+                                                     full_jitter=True)
+        raise self.retry(args=[unsent, email], exc=error, countdown=countdown)
+
+
+@shared_task(autoretry_for=RETRY_EXCEPTIONS, retry_backoff=True, retry_jitter=True, max_retries=5)
+def send_order_tickets(order_id, email, single_pdf=True):
+    """Sending all tickets of the order in one email."""
+    tickets = Ticket.objects.filter(order_id=order_id).select_related('flight').prefetch_related(
+        'flight_facilities__facilities'
+    )
+    send_order_tickets_email(order_id, list(tickets), email, single_pdf)
+
+
+@shared_task
+def deliver_order_tickets(order_id):
+    """Sending the tickets of a paid order, in one email or per ticket depending on SEND_TICKETS_PER_ORDER."""
+    email = Order.objects.filter(id=order_id).values_list('user__email', flat=True).first()
+    if email is None:
+        return
+    if settings.SEND_TICKETS_PER_ORDER:
+        send_order_tickets.delay(order_id, email)
+    else:
+        send_ticket_batch.delay(list(Ticket.objects.filter(order_id=order_id).values_list('id', flat=True)), email)
@@ -0,0 +1,906 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import requests
+from celery.exceptions import Retry as TaskRetry
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.http.request import RawPostDataException
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+from urllib3.util.retry import Retry
+
+from customer_interface.management.commands.explain_queries import hot_queries, full_scans
+from customer_interface.models import Airplane, Basket, BasketNotification, Flight, Order, ProcessedPayment, \
+    SeatInventory, Ticket, TicketEvent
+from customer_interface.tasks import deliver_order_tickets, release_expired_holds, send_order_tickets, \
+    send_ticket_batch
+from customer_interface.utils import mailer, ticket_artifacts, wayforpay
+from customer_interface.utils.booking import book_ticket, claim_available_ticket
+from customer_interface.utils.cache import cached_flight, cached_free_seats
+from customer_interface.utils.flight_search import search_flights, encode_cursor, decode_cursor
+from customer_interface.utils.payments import APPROVED_CODE, parse_callback, reconcile_pending_orders
+from customer_interface.utils.price_quote import price_quotes
+from customer_interface.utils.synthetic import seed_flights, seed_order, create_customer
+from customer_interface.utils.ticket_codes import sign_ticket
+from customer_interface.utils.ticket_states import transition_many, transition_one
+from customer_interface.utils.wayforpay import create_check_status_params, encode_order_reference
+from customer_interface.validators import validate_ticket_seats
+
+# The shared cache lives outside the test database (a directory or Redis), so tests do not cache by default
+NO_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+
+
+def create_flight(airplane, place_of_departure='Kyiv', place_of_arrival='Lviv', days=1):
+    departure = django_timezone.now() + timedelta(days=days)
+    flight = Flight(date_time_of_departure=departure, date_time_of_arrival=departure + timedelta(hours=2),
+                    place_of_departure=place_of_departure, place_of_arrival=place_of_arrival, airplane=airplane,
+                    price_economy_seats=100, price_business_seats=300,
+                    price_number_economy_seats=10, price_number_business_seats=20)
+    flight.clean()
+    flight.save()
+    return flight
+
+
+@override_settings(CACHES=NO_CACHES)
+class IndexViewQueriesTest(TestCase):
+    def setUp(self):
+        self.rng = random.Random(42)
+        # A superuser sees the sold, check-in and boarding counters of every flight
+        self.client.force_login(create_customer('staff@example.com', is_superuser=True))
+
+    def get_home(self):
+        response = self.client.get(reverse('customer_interface:home'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_flights(self):
+        seed_flights(10, self.rng, fill=0.1)
+        with CaptureQueriesContext(connection) as small:
+            self.get_home()
+
+        seed_flights(990, self.rng, fill=0.1)
+        with self.assertNumQueries(len(small)):
+            response = self.get_home()
+        self.assertEqual(len(response.context['object_list']), 20)
+
+
+@override_settings(CACHES=NO_CACHES)
+class FlightSearchTest(TestCase):
+    def setUp(self):
+        self.airplane = Airplane.objects.create(economy_seats=30, business_seats=10)
+
+    def test_prefix_of_normalized_name(self):
+        new_york = create_flight(self.airplane, place_of_departure='New  York')
+        create_flight(self.airplane, place_of_departure='Newark')
+        self.assertEqual(list(search_flights(Flight.objects.all(), place_of_departure='new y')), [new_york])
+        self.assertEqual(search_flights(Flight.objects.all(), place_of_departure='NEW').count(), 2)
+        # Only the start of the name is matched
+        self.assertFalse(search_flights(Flight.objects.all(), place_of_departure='York').exists())
+
+    def test_cursor_before_1970(self):
+        flight = Flight(pk=7, date_time_of_departure=datetime(1969, 7, 20, 20, 17, tzinfo=dt_timezone.utc))
+        self.assertEqual(decode_cursor(encode_cursor(flight)), (flight.date_time_of_departure, 7))
+        self.assertIsNone(decode_cursor('garbage'))
+
+
+@override_settings(CACHES=NO_CACHES)
+class SeatInventoryRebuildTest(TestCase):
+    def test_rebuild_when_another_writer_creates_the_row(self):
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        Ticket.objects.create(flight=flight, seat_class='economy', seat_number=2)
+        SeatInventory.objects.filter(flight=flight, seat_class='economy').update(held=0, occupied=0)
+
+        # The first UPDATE finds no row, the row is inserted by the other writer before our INSERT
+        real_update = QuerySet.update
+        calls = []
+
+        def update(queryset, **values):
+            calls.append(values)
+            return 0 if len(calls) == 1 else real_update(queryset, **values)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update):
+            inventory = SeatInventory.rebuild(flight.pk, 'economy')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((inventory.occupied, inventory.held), (SeatInventory.seat_mask(2), 1))
+
+
+@override_settings(CACHES=NO_CACHES)
+class ValidateTicketSeatsTest(TestCase):
+    def setUp(self):
+        self.flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.taken = Ticket.objects.create(flight=self.flight, seat_class='economy', seat_number=5, status='booked')
+        self.tickets = [Ticket.objects.create(flight=self.flight, seat_class='economy') for _number in range(2)]
+
+    def test_free_seats_are_validated_with_one_query(self):
+        with self.assertNumQueries(1):
+            seats = validate_ticket_seats([(self.tickets[0], '1'), (self.tickets[1], None), (self.taken, '5')],
+                                          Ticket)
+        self.assertEqual(seats, [1, None, 5])
+
+    def test_same_seat_twice_in_one_batch(self):
+        with self.assertRaisesMessage(ValidationError, 'this seat is busy'):
+            validate_ticket_seats([(ticket, '7') for ticket in self.tickets], Ticket)
+
+    def test_seat_out_of_range(self):
+        for seat_number in ('0', '31', 'A1'):
+            with self.subTest(seat_number), self.assertRaisesMessage(ValidationError, 'Not a valid seat number'):
+                validate_ticket_seats([(self.tickets[0], seat_number)], Ticket)
+
+    def test_seat_taken_by_another_ticket(self):
+        with self.assertRaisesMessage(ValidationError, 'this seat is busy'):
+            validate_ticket_seats([(self.tickets[0], '5')], Ticket)
+
+
+@override_settings(CACHES=NO_CACHES)
+class FlightDeletionTest(TestCase):
+    def setUp(self):
+        self.airplane = Airplane.objects.create(economy_seats=30, business_seats=10)
+        self.flights = [create_flight(self.airplane, days=days) for days in (1, 2)]
+        for flight in self.flights:
+            Ticket.objects.create(flight=flight, seat_class='economy', seat_number=3, status='checked_out')
+            Ticket.objects.create(flight=flight, seat_class='business', status='booked')
+
+    def assertDeletedWithInventories(self):
+        flight_ids = [flight.pk for flight in self.flights]
+        self.assertFalse(Flight.objects.filter(id__in=flight_ids).exists())
+        self.assertFalse(Ticket.objects.filter(flight_id__in=flight_ids).exists())
+        self.assertFalse(SeatInventory.objects.filter(flight_id__in=flight_ids).exists())
+        connection.check_constraints()
+
+    def test_queryset_delete(self):
+        Flight.objects.filter(airplane=self.airplane).delete()
+        self.assertDeletedWithInventories()
+
+    def test_airplane_delete(self):
+        self.airplane.delete()
+        self.assertDeletedWithInventories()
+
+    def test_ticket_delete_releases_the_seat(self):
+        flight = self.flights[0]
+        Ticket.objects.filter(flight=flight, seat_class='economy').delete()
+        inventory = SeatInventory.objects.get(flight=flight, seat_class='economy')
+        self.assertEqual((inventory.occupied, inventory.sold), (0, 0))
+
+
+@override_settings(CACHES=NO_CACHES)
+class RepairSeatInventoryTest(TestCase):
+    def setUp(self):
+        airplane = Airplane.objects.create(economy_seats=30, business_seats=10)
+        self.flight, self.intact = create_flight(airplane), create_flight(airplane, days=2)
+        for flight in (self.flight, self.intact):
+            Ticket.objects.create(flight=flight, seat_class='economy', seat_number=1, status='checked_out')
+            Ticket.objects.create(flight=flight, seat_class='business', seat_number=2)
+        # Drift: a wrong bitmap and counters, and a missing inventory row
+        SeatInventory.objects.filter(flight=self.flight, seat_class='economy').update(occupied=0b110, sold=5)
+        SeatInventory.objects.filter(flight=self.flight, seat_class='business').delete()
+
+    def inventories(self):
+        return {
+            (inventory.flight_id, inventory.seat_class): (inventory.occupied, inventory.held, inventory.sold)
+            for inventory in SeatInventory.objects.all()
+        }
+
+    def test_dry_run_only_reports(self):
+        before = self.inventories()
+        out = StringIO()
+        call_command('repair_seat_inventory', '--dry-run', stdout=out)
+        self.assertIn('2 seat inventories of 2 flights would be repaired', out.getvalue())
+        self.assertEqual(self.inventories(), before)
+
+    def test_repair(self):
+        out = StringIO()
+        call_command('repair_seat_inventory', stdout=out)
+        self.assertIn('2 seat inventories of 2 flights repaired', out.getvalue())
+        self.assertEqual(self.inventories(), {
+            (flight.pk, seat_class): values
+            for flight in (self.flight, self.intact)
+            for seat_class, values in (('economy', (SeatInventory.seat_mask(1), 0, 1)),
+                                       ('business', (SeatInventory.seat_mask(2), 1, 0)))
+        })
+
+        call_command('repair_seat_inventory', stdout=out)
+        self.assertIn('0 seat inventories of 2 flights repaired', out.getvalue())
+
+
+@override_settings(CACHES=NO_CACHES)
+@skipUnlessDBFeature('has_select_for_update')
+class BookLastSeatConcurrencyTest(TransactionTestCase):
+    buyers = 8
+
+    def test_last_seat_is_sold_once(self):
+        flight = create_flight(Airplane.objects.create(economy_seats=1, business_seats=1))
+        baskets = [Basket.objects.get(user=create_customer(f'buyer{number}@example.com'))
+                   for number in range(self.buyers)]
+        start = threading.Barrier(self.buyers)
+        booked = []
+        rejected = []
+
+        def buy(basket):
+            try:
+                start.wait()
+                try:
+                    booked.append(book_ticket(flight.pk, 'economy', basket))
+                except ValidationError:
+                    rejected.append(basket)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=[basket]) for basket in baskets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((len(booked), len(rejected)), (1, self.buyers - 1))
+        self.assertEqual(Ticket.objects.filter(flight=flight, seat_class='economy').count(), 1)
+        self.assertEqual(SeatInventory.objects.get(flight=flight, seat_class='economy').remaining(), 0)
+
+
+@override_settings(CACHES=NO_CACHES, TICKET_HOLD_TTL=timedelta(minutes=1))
+class ReleaseExpiredHoldsTest(TestCase):
+    def test_expired_holds_are_released(self):
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        expired = [Ticket.objects.create(flight=flight, seat_class=seat_class, seat_number=seat_number)
+                   for seat_class, seat_number in (('economy', 1), ('economy', None), ('business', 2))]
+        fresh = Ticket.objects.create(flight=flight, seat_class='economy', seat_number=3)
+        paid = Ticket.objects.create(flight=flight, seat_class='economy', seat_number=4, status='checked_out')
+        Ticket.objects.filter(id__in=[ticket.pk for ticket in expired + [paid]]).update(
+            created_at=django_timezone.now() - timedelta(minutes=2))
+
+        with mock.patch('customer_interface.tasks.transition_many', wraps=transition_many) as transition:
+            self.assertEqual(release_expired_holds(), 3)
+        transition.assert_called_once()
+
+        statuses = dict(Ticket.objects.values_list('id', 'status'))
+        self.assertEqual({statuses[ticket.pk] for ticket in expired}, {'available'})
+        self.assertEqual((statuses[fresh.pk], statuses[paid.pk]), ('booked', 'checked_out'))
+        self.assertEqual(TicketEvent.objects.filter(from_state='booked', to_state='available').count(), 3)
+        for inventory in SeatInventory.objects.filter(flight=flight):
+            with self.subTest(inventory.seat_class):
+                self.assertEqual(
+                    {counter: getattr(inventory, counter) for counter in SeatInventory.COUNTERS},
+                    SeatInventory.count(Ticket.objects.filter(flight=flight, seat_class=inventory.seat_class)),
+                )
+        economy = SeatInventory.objects.get(flight=flight, seat_class='economy')
+        self.assertEqual((economy.held, economy.sold), (1, 1))
+
+
+@override_settings(CACHES=NO_CACHES)
+class ExpiredTicketReclaimTest(TestCase):
+    def setUp(self):
+        self.flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.user = create_customer('buyer@example.com')
+        self.basket = Basket.objects.get(user=self.user)
+
+    def expire(self, ticket):
+        transition_many([ticket.pk], 'booked', 'available')
+
+    def test_other_buyer_is_notified(self):
+        other_basket = Basket.objects.get(user=create_customer('late@example.com'))
+        ticket = book_ticket(self.flight.pk, 'economy', other_basket)
+        self.expire(ticket)
+
+        self.assertEqual(book_ticket(self.flight.pk, 'economy', self.basket).pk, ticket.pk)
+        self.assertEqual(list(self.basket.tickets.all()), [ticket])
+        self.assertFalse(other_basket.tickets.exists())
+        self.assertEqual(BasketNotification.objects.filter(basket=other_basket).count(), 1)
+
+    def test_claim_statements(self):
+        other_basket = Basket.objects.get(user=create_customer('late@example.com'))
+        ticket = book_ticket(self.flight.pk, 'economy', other_basket)
+        Ticket.objects.filter(pk=ticket.pk).update(seat_number=4)
+        self.expire(ticket)
+
+        # The candidate read, the conditional UPDATE of the ticket, the inventory UPDATE, the TicketEvent
+        # INSERT, then the notification INSERT and the basket link UPDATE for the buyer who lost it
+        with self.assertNumQueries(6):
+            self.assertEqual(claim_available_ticket(self.flight, 'economy', self.basket).pk, ticket.pk)
+        inventory = SeatInventory.objects.get(flight=self.flight, seat_class='economy')
+        self.assertEqual((inventory.occupied, inventory.held), (0, 1))
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).seat_number, None)
+
+    def test_changed_candidate_is_not_claimed(self):
+        ticket = book_ticket(self.flight.pk, 'economy', self.basket)
+        self.expire(ticket)
+        row = Ticket.objects.values_list(*SeatInventory.TICKET_STATE).get(pk=ticket.pk)
+        # Paid after the hold expired, between the read and the UPDATE
+        transition_many([ticket.pk], 'available', 'checked_out')
+
+        self.assertFalse(transition_one(row, 'booked'))
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).status, 'checked_out')
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='economy').held, 0)
+
+    def test_own_ticket_is_reclaimed_silently(self):
+        ticket = book_ticket(self.flight.pk, 'economy', self.basket)
+        self.expire(ticket)
+
+        self.assertEqual(book_ticket(self.flight.pk, 'economy', self.basket).pk, ticket.pk)
+        self.assertEqual(list(self.basket.tickets.all()), [ticket])
+        self.assertFalse(BasketNotification.objects.exists())
+
+    def test_basket_view_deletes_only_the_shown_notifications(self):
+        shown = BasketNotification.objects.create(basket=self.basket, message='Removed from your cart')
+        other = BasketNotification.objects.create(
+            basket=Basket.objects.get(user=create_customer('other@example.com')), message='Not yours')
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('customer_interface:basket'))
+        self.assertEqual(response.context['basket_messages'], [shown.message])
+        self.assertEqual(list(BasketNotification.objects.all()), [other])
+
+
+@override_settings(CACHES=LOCAL_CACHES, PRICE_QUOTE_CACHE='shared', PRICE_QUOTE_VERSION_TTL=60)
+class PriceQuoteTest(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        price_quotes.clear()
+        self.flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+
+    def test_local_hit_does_not_read_the_shared_cache(self):
+        self.assertEqual(price_quotes.get(self.flight.pk, 'economy'), 100)
+        with mock.patch.object(caches['shared'], 'get_or_set') as get_or_set, self.assertNumQueries(0):
+            self.assertEqual(price_quotes.get(self.flight.pk, 'economy'), 100)
+        get_or_set.assert_not_called()
+
+    def test_invalidated_after_commit(self):
+        self.assertEqual(price_quotes.get(self.flight.pk, 'economy'), 100)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.flight.price_economy_seats = 150
+            self.flight.save()
+            # Not committed yet, so nothing is invalidated
+            self.assertEqual(price_quotes.get(self.flight.pk, 'economy'), 100)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(price_quotes.get(self.flight.pk, 'economy'), 150)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CacheInvalidationTest(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+
+    def test_flight_invalidated_after_commit(self):
+        cached_flight(self.flight.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.flight.place_of_arrival = 'Rome'
+            self.flight.save()
+            # A reader before the commit still gets the committed flight from the cache
+            self.assertEqual(cached_flight(self.flight.pk).place_of_arrival, 'Lviv')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cached_flight(self.flight.pk).place_of_arrival, 'Rome')
+
+    def test_free_seats_invalidated_after_booking(self):
+        self.assertIn(2, cached_free_seats(self.flight)[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(flight=self.flight, seat_class='economy', seat_number=2)
+        self.assertNotIn(2, cached_free_seats(self.flight)[0])
+
+
+def use_temporary_artifact_dir(test_case):
+    """Points TICKET_ARTIFACT_DIR of the test to a fresh directory, removed afterwards."""
+    artifact_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, artifact_dir, ignore_errors=True)
+    settings_override = override_settings(TICKET_ARTIFACT_DIR=artifact_dir)
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    return artifact_dir
+
+
+@override_settings(CACHES=NO_CACHES)
+class MailerTest(TestCase):
+    def setUp(self):
+        use_temporary_artifact_dir(self)
+        self.addCleanup(mailer.close_worker_connection)
+
+    @staticmethod
+    def message():
+        return EmailMessage('Subject', 'Body', 'airwise@example.com', ['buyer@example.com'])
+
+    def test_web_process_does_not_keep_a_connection(self):
+        self.assertEqual(mailer.deliver([self.message()]), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNone(getattr(mailer._local, 'connection', None))
+
+    def test_worker_reuses_its_connection(self):
+        with mock.patch.object(mailer, '_persistent', True):
+            mailer.deliver([self.message()])
+            connection = mailer._local.connection
+            mailer.deliver([self.message(), self.message()])
+            self.assertIs(mailer._local.connection, connection)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @staticmethod
+    def drop_connection_once(subject):
+        """Makes the connection fail once, when the message with the subject is sent."""
+        send_messages = locmem.EmailBackend.send_messages
+        failed = []
+
+        def send(backend, messages):
+            if not failed and messages[0].subject == subject:
+                failed.append(subject)
+                raise SMTPServerDisconnected('Connection unexpectedly closed')
+            return send_messages(backend, messages)
+
+        return mock.patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=send)
+
+    def test_worker_resends_only_the_unsent_messages(self):
+        messages = [EmailMessage(f'Ticket {number}', 'Body', 'airwise@example.com', ['buyer@example.com'])
+                    for number in (1, 2, 3)]
+        with mock.patch.object(mailer, '_persistent', True), self.drop_connection_once('Ticket 2'):
+            self.assertEqual(mailer.deliver(messages), 3)
+        self.assertEqual([message.subject for message in mail.outbox], ['Ticket 1', 'Ticket 2', 'Ticket 3'])
+
+    def test_partial_send_reports_the_unsent_messages(self):
+        messages = [EmailMessage(f'Ticket {number}', 'Body', 'airwise@example.com', ['buyer@example.com'])
+                    for number in (1, 2, 3)]
+        with self.drop_connection_once('Ticket 2'), self.assertRaises(mailer.DeliveryFailed) as failed:
+            mailer.deliver(messages)
+        self.assertEqual(failed.exception.unsent, messages[1:])
+        self.assertEqual([message.subject for message in mail.outbox], ['Ticket 1'])
+
+
+@override_settings(CACHES=NO_CACHES)
+class DeliverOrderTicketsTest(TestCase):
+    def setUp(self):
+        use_temporary_artifact_dir(self)
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.order = Order.objects.create(user=create_customer('buyer@example.com'))
+        self.tickets = [Ticket.objects.create(flight=flight, seat_class='economy', seat_number=seat_number,
+                                              order=self.order, status='checked_out')
+                        for seat_number in (1, 2, 3)]
+
+    @override_settings(SEND_TICKETS_PER_ORDER=False)
+    def test_a_pdf_per_ticket_over_one_connection(self):
+        with mock.patch.object(send_ticket_batch, 'delay', side_effect=send_ticket_batch), \
+                mock.patch.object(mailer, 'get_connection', wraps=mailer.get_connection) as connections:
+            deliver_order_tickets(self.order.id)
+        connections.assert_called_once()
+        self.assertEqual([message.to for message in mail.outbox], [['buyer@example.com']] * 3)
+        attachments = sorted(attachment for message in mail.outbox for attachment in message.attachments)
+        self.assertEqual([filename for filename, _content, _mimetype in attachments],
+                         sorted(f'ticket_{ticket.id}.pdf' for ticket in self.tickets))
+        self.assertTrue(all(content.startswith(b'%PDF') for _filename, content, _mimetype in attachments))
+
+    def test_batch_retry_sends_only_the_unsent_tickets(self):
+        ticket_ids = [ticket.id for ticket in self.tickets]
+        failed_ticket = Ticket.objects.get(id=ticket_ids[1])
+        send_messages = locmem.EmailBackend.send_messages
+
+        def send(backend, messages):
+            if messages[0].attachments[0][0] == f'ticket_{failed_ticket.id}.pdf':
+                raise SMTPServerDisconnected('Connection unexpectedly closed')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=send), \
+                mock.patch.object(send_ticket_batch, 'retry', return_value=TaskRetry()) as retry:
+            with self.assertRaises(TaskRetry):
+                send_ticket_batch(ticket_ids, 'buyer@example.com')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(retry.call_args.kwargs['args'], [ticket_ids[1:], 'buyer@example.com'])
+
+    @override_settings(SEND_TICKETS_PER_ORDER=True)
+    def test_one_pdf_per_order(self):
+        with mock.patch.object(send_order_tickets, 'delay', side_effect=send_order_tickets):
+            deliver_order_tickets(self.order.id)
+        self.assertEqual(len(mail.outbox), 1)
+        [(filename, content, _mimetype)] = mail.outbox[0].attachments
+        self.assertEqual(filename, f'order_{self.order.id}_tickets.pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+
+@override_settings(CACHES=NO_CACHES)
+class TicketArtifactTest(TestCase):
+    def setUp(self):
+        self.artifact_dir = use_temporary_artifact_dir(self)
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.ticket = Ticket.objects.create(flight=flight, seat_class='economy', status='checked_out')
+
+    def test_read_renders_again_when_evicted_before_the_open(self):
+        get_artifact = ticket_artifacts.get_artifact
+        calls = []
+
+        def evicted_after_lookup(key, render):
+            path = get_artifact(key, render)
+            if not calls:
+                os.remove(path)
+            calls.append(path)
+            return path
+
+        with mock.patch.object(ticket_artifacts, 'get_artifact', side_effect=evicted_after_lookup):
+            pdf = ticket_artifacts.read_artifact(*ticket_artifacts.ticket_artifact(self.ticket))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(len(calls), 2)
+
+    def test_rendering_does_not_evict(self):
+        with override_settings(TICKET_ARTIFACT_MAX_BYTES=1), mock.patch.object(os, 'scandir') as scandir:
+            path = ticket_artifacts.ticket_pdf_path(self.ticket)
+        scandir.assert_not_called()
+        self.assertTrue(os.path.exists(path))
+
+        with override_settings(TICKET_ARTIFACT_MAX_BYTES=1):
+            self.assertEqual(ticket_artifacts.evict_artifacts(), 1)
+        self.assertEqual(os.listdir(self.artifact_dir), [])
+
+
+class FakeWayForPay(ThreadingHTTPServer):
+    """
+    A local WayForPay API for the tests. Every POSTed JSON document is recorded in requests and answered
+    with answer(params), which returns (HTTP status, JSON body, delay in seconds).
+    """
+    daemon_threads = True
+
+    def __init__(self, test_case):
+        super().__init__(('127.0.0.1', 0), FakeWayForPayHandler)
+        self.requests = []
+        self.answer = lambda params: (200, {}, 0)
+        threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        test_case.addCleanup(self.server_close)
+        test_case.addCleanup(self.shutdown)
+        self.url = f'http://127.0.0.1:{self.server_port}/api'
+        settings_override = override_settings(WAYFORPAY_API=self.url)
+        settings_override.enable()
+        test_case.addCleanup(settings_override.disable)
+        # The session and its pool are created again for the settings of the test
+        wayforpay.close_session()
+        test_case.addCleanup(wayforpay.close_session)
+
+    def handle_error(self, request, client_address):
+        pass  # The client gave up on a delayed answer
+
+
+class FakeWayForPayHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        params = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(params)
+        status, body, delay = self.server.answer(params)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(CACHES=NO_CACHES)
+class WayForPayCallbackPayloadTest(TestCase):
+    def setUp(self):
+        self.url = reverse('customer_interface:wayforpay_callback')
+        order = Order.objects.create(user=create_customer('buyer@example.com'))
+        # A declined payment, so the callback only acknowledges it
+        self.payload = {'orderReference': encode_order_reference(order.id), 'reasonCode': 1101}
+
+    def test_json_body(self):
+        response = self.client.post(self.url, self.payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['orderReference'], self.payload['orderReference'])
+
+    def test_json_in_form_key(self):
+        response = self.client.post(self.url, {json.dumps(self.payload): ''})
+        self.assertEqual(response.status_code, 200)
+
+    def test_malformed_payloads_are_rejected(self):
+        response = self.client.post(self.url, [self.payload], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'not json': ''}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+
+    def test_json_array_with_consumed_stream(self):
+        class StreamConsumedRequest:
+            # Behind a WSGI server DRF has already read the stream, so the body can not be read again
+            data = [self.payload]
+
+            @property
+            def body(self):
+                raise RawPostDataException
+
+        with self.assertRaises(ValueError):
+            parse_callback(StreamConsumedRequest())
+
+
+@override_settings(CACHES=NO_CACHES)
+class PaymentCallbackIdempotencyTest(TestCase):
+    def test_repeated_callback_is_applied_once(self):
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        order = Order.objects.create(user=create_customer('buyer@example.com'))
+        for seat_number in (1, 2):
+            Ticket.objects.create(flight=flight, seat_class='economy', seat_number=seat_number, order=order)
+        payload = {'orderReference': encode_order_reference(order.id), 'reasonCode': APPROVED_CODE}
+        url = reverse('customer_interface:wayforpay_callback')
+
+        with mock.patch.object(deliver_order_tickets, 'delay') as deliver:
+            for _attempt in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(url, payload, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['status'], 'accept')
+
+        deliver.assert_called_once_with(order.id)
+        self.assertEqual(ProcessedPayment.objects.filter(order=order).count(), 1)
+        self.assertEqual(set(order.tickets.values_list('status', flat=True)), {'checked_out'})
+        self.assertEqual(TicketEvent.objects.filter(to_state='checked_out').count(), 2)
+        inventory = SeatInventory.objects.get(flight=flight, seat_class='economy')
+        self.assertEqual((inventory.held, inventory.sold), (0, 2))
+
+@override_settings(WAYFORPAY_TIMEOUT=(1, 0.3), WAYFORPAY_RETRIES=2, WAYFORPAY_POOL_SIZE=4)
+class WayForPayClientTest(SimpleTestCase):
+    def setUp(self):
+        self.gateway = FakeWayForPay(self)
+        self.params = create_check_status_params(1)
+        # The backoff between the attempts is not what is tested here
+        patcher = mock.patch.object(Retry, 'get_backoff_time', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def answer_in_turn(self, *answers):
+        answers = list(answers)
+        self.gateway.answer = lambda params: answers.pop(0)
+
+    def test_post_is_retried_on_gateway_errors(self):
+        # allowed_methods=None: urllib3 repeats the POST although it is not idempotent
+        self.answer_in_turn((503, {}, 0), (502, {}, 0), (200, {'reasonCode': 1100}, 0))
+        response = wayforpay.send_request(self.params)
+        self.assertEqual((response.status_code, response.json()), (200, {'reasonCode': 1100}))
+        self.assertEqual(self.gateway.requests, [self.params] * 3)
+
+    def test_last_error_is_returned_when_retries_run_out(self):
+        self.gateway.answer = lambda params: (503, {}, 0)
+        self.assertEqual(wayforpay.send_request(self.params).status_code, 503)
+        self.assertEqual(len(self.gateway.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.gateway.answer = lambda params: (500, {}, 0)
+        self.assertEqual(wayforpay.send_request(self.params).status_code, 500)
+        self.assertEqual(len(self.gateway.requests), 1)
+
+    def test_read_timeout_is_retried_then_raised(self):
+        # The gateway got every attempt, a POST is repeated even after it may have been processed
+        self.gateway.answer = lambda params: (200, {}, 0.6)
+        with self.assertRaises(requests.RequestException):
+            wayforpay.send_request(self.params)
+        self.assertEqual(len(self.gateway.requests), 3)
+
+    def test_threads_share_one_session(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            sessions = set(executor.map(lambda _number: wayforpay.get_session(), range(8)))
+        self.assertEqual(sessions, {wayforpay.get_session()})
+        adapter = wayforpay.get_session().get_adapter(self.gateway.url)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 4)
+
+@override_settings(CACHES=NO_CACHES, WAYFORPAY_TIMEOUT=(1, 1), WAYFORPAY_RETRIES=0, WAYFORPAY_RECONCILE_WORKERS=3)
+class ReconcilePendingOrdersTest(TestCase):
+    def setUp(self):
+        self.gateway = FakeWayForPay(self)
+        self.flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.user = create_customer('buyer@example.com')
+
+    def create_order(self, age=timedelta(minutes=30)):
+        order = Order.objects.create(user=self.user)
+        Ticket.objects.create(flight=self.flight, seat_class='economy', order=order)
+        Order.objects.filter(id=order.id).update(created_order=django_timezone.now() - age)
+        return order
+
+    def test_only_approved_orders_are_checked_out(self):
+        approved, declined, failed, unreadable = (self.create_order() for _number in range(4))
+        recent = self.create_order(age=timedelta(minutes=1))
+        answers = {
+            encode_order_reference(approved.id): (200, {'reasonCode': APPROVED_CODE}, 0),
+            encode_order_reference(declined.id): (200, {'reasonCode': 1101}, 0),
+            encode_order_reference(failed.id): (500, {}, 0),
+        }
+        self.gateway.answer = lambda params: answers.get(params['orderReference'], (200, 'not a status', 0))
+
+        with mock.patch.object(deliver_order_tickets, 'delay') as deliver, \
+                self.captureOnCommitCallbacks(execute=True), \
+                self.assertLogs('customer_interface.utils.payments', 'WARNING') as logs:
+            self.assertEqual(reconcile_pending_orders(), 1)
+
+        self.assertEqual(sorted(params['orderReference'] for params in self.gateway.requests),
+                         sorted(encode_order_reference(order.id) for order in (approved, declined, failed, unreadable)))
+        self.assertTrue(all(params['transactionType'] == 'CHECK_STATUS' for params in self.gateway.requests))
+        # The failed and the unreadable answers
+        self.assertEqual(len(logs.records), 2)
+        deliver.assert_called_once_with(approved.id)
+        self.assertEqual(list(ProcessedPayment.objects.values_list('order_id', flat=True)), [approved.id])
+        statuses = dict(Ticket.objects.values_list('order_id', 'status'))
+        self.assertEqual(statuses, {approved.id: 'checked_out', declined.id: 'booked', failed.id: 'booked',
+                                    unreadable.id: 'booked', recent.id: 'booked'})
+
+    def test_paid_orders_are_not_polled_again(self):
+        order = self.create_order()
+        self.gateway.answer = lambda params: (200, {'reasonCode': APPROVED_CODE}, 0)
+        with mock.patch.object(deliver_order_tickets, 'delay'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reconcile_pending_orders(), 1)
+            self.assertEqual(reconcile_pending_orders(), 0)
+        self.assertEqual(len(self.gateway.requests), 1)
+        self.assertEqual(ProcessedPayment.objects.get().order_id, order.id)
+
+
+@override_settings(CACHES=NO_CACHES)
+class TicketCheckInTest(TestCase):
+    def setUp(self):
+        flight = create_flight(Airplane.objects.create(economy_seats=30, business_seats=10))
+        self.ticket = Ticket.objects.create(flight=flight, seat_class='economy', status='checked_out')
+        self.manager = create_customer('manager@example.com', is_superuser=True)
+        self.client.force_login(self.manager)
+
+    def test_check_in_sends_the_ticket(self):
+        with mock.patch('customer_interface.views.send_tickets.apply_async') as apply_async:
+            response = self.client.post(reverse('customer_interface:ticket_detail', args=[self.ticket.id]))
+        self.assertRedirects(response, reverse('customer_interface:ticket_input'), fetch_redirect_response=False)
+        apply_async.assert_called_once_with(args=[self.ticket.id, self.manager.email])
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.check_in_manager, self.manager)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsViewTest(TestCase):
+    def test_bearer_token_is_required(self):
+        url = reverse('customer_interface:metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secre').status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer sécret').status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+@override_settings(CACHES=NO_CACHES)
+class HotQueryPlanTest(TestCase):
+    def test_hot_ticket_queries_use_indexes(self):
+        rng = random.Random(42)
+        flight_ids = seed_flights(200, rng, 0.8)
+        order = seed_order(create_customer('explain@example.com'), flight_ids, rng)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                # The test table is small, the planner may prefer a seq scan although an index matches
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for name, queryset in hot_queries(flight_ids[len(flight_ids) // 2], order.id).items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertEqual(full_scans(plan), [], plan)
+
+
+@override_settings(CACHES=NO_CACHES)
+class TicketGateTest(TestCase):
+    def setUp(self):
+        self.airplane = Airplane.objects.create(economy_seats=30, business_seats=10)
+        self.ticket = Ticket.objects.create(flight=create_flight(self.airplane), seat_class='economy',
+                                            status='checked_out')
+        self.client.force_login(create_customer('gate@example.com', is_superuser=True))
+        self.url = reverse('customer_interface:ticket_gate')
+
+    def test_signed_code_passes(self):
+        response = self.client.post(self.url, {'ticket_id': sign_ticket(self.ticket)})
+        self.assertNotIn('error_message', response.context)
+        self.ticket.refresh_from_db()
+        self.assertIsNotNone(self.ticket.time_gate)
+        self.assertEqual(SeatInventory.objects.get(flight=self.ticket.flight, seat_class='economy').boarded, 1)
+
+    def test_boarded_once(self):
+        code = sign_ticket(self.ticket)
+        self.client.post(self.url, {'ticket_id': code})
+        response = self.client.post(self.url, {'ticket_id': code})
+        self.assertEqual(response.context['error_message'], 'The ticket has already been boarded')
+        self.assertEqual(SeatInventory.objects.get(flight=self.ticket.flight, seat_class='economy').boarded, 1)
+
+    def test_unpaid_ticket_is_rejected(self):
+        Ticket.objects.filter(id=self.ticket.id).update(status='booked')
+        response = self.client.post(self.url, {'ticket_id': sign_ticket(self.ticket)})
+        self.assertEqual(response.context['error_message'], 'The ticket is not paid')
+        self.ticket.refresh_from_db()
+        self.assertIsNone(self.ticket.gate_manager)
+        self.assertIsNone(self.ticket.time_gate)
+
+    def test_typed_id_and_foreign_flight_are_rejected(self):
+        signed_for_another_flight = sign_ticket(
+            Ticket(id=self.ticket.id, flight_id=create_flight(self.airplane, days=2).id))
+        for code in (str(self.ticket.id), signed_for_another_flight):
+            with self.subTest(code):
+                response = self.client.post(self.url, {'ticket_id': code})
+                self.assertIn('error_message', response.context)
+        self.ticket.refresh_from_db()
+        self.assertIsNone(self.ticket.time_gate)
+
+
+@override_settings(CACHES=NO_CACHES)
+class BoardingViewTest(TestCase):
+    def setUp(self):
+        self.airplane = Airplane.objects.create(economy_seats=30, business_seats=10)
+        self.flight = create_flight(self.airplane)
+        self.tickets = [Ticket.objects.create(flight=self.flight, seat_class='economy', status='checked_out')
+                        for _ in range(3)]
+        self.gate_manager = create_customer('gate@example.com')
+        self.gate_manager.user_permissions.add(Permission.objects.get(codename='add_ticket'))
+        self.client.force_login(self.gate_manager)
+        self.url = reverse('customer_interface:boarding', args=[self.flight.id])
+
+    def board(self, codes):
+        return self.client.post(self.url, {'tickets': codes}, content_type='application/json')
+
+    def test_results(self):
+        boarded, repeated, unpaid = self.tickets
+        self.board([sign_ticket(repeated)])
+        Ticket.objects.filter(id=unpaid.id).update(status='booked')
+        foreign = Ticket.objects.create(flight=create_flight(self.airplane, days=2), seat_class='economy',
+                                        status='checked_out')
+        # A code signed for this flight of a ticket which was moved to another one
+        moved = Ticket.objects.create(flight=foreign.flight, seat_class='economy', status='checked_out')
+        signed_for_this_flight = sign_ticket(Ticket(id=moved.id, flight_id=self.flight.id))
+        codes = [
+            sign_ticket(boarded), sign_ticket(boarded), sign_ticket(repeated), sign_ticket(unpaid),
+            sign_ticket(foreign), signed_for_this_flight, sign_ticket(Ticket(id=0, flight_id=self.flight.id)),
+            'forged', str(boarded.id),
+        ]
+
+        response = self.board(codes)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['result'] for result in response.json()['results']], [
+            'boarded', 'duplicate', 'already_boarded', 'not_paid', 'wrong_flight', 'wrong_flight',
+            'not_found', 'invalid_code', 'invalid_code',
+        ])
+        boarded.refresh_from_db()
+        self.assertEqual(boarded.gate_manager, self.gate_manager)
+        unpaid.refresh_from_db()
+        self.assertIsNone(unpaid.gate_manager)
+        foreign.refresh_from_db()
+        self.assertIsNone(foreign.gate_manager)
+
+    def test_counters(self):
+        response = self.board([sign_ticket(ticket) for ticket in self.tickets[:2]])
+        self.assertEqual((response.json()['boarded'], response.json()['remaining']), (2, 1))
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='economy').boarded, 2)
+
+        response = self.board([sign_ticket(ticket) for ticket in self.tickets])
+        self.assertEqual((response.json()['boarded'], response.json()['remaining']), (3, 0))
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='economy').boarded, 3)
+
+    def test_permissions(self):
+        codes = [sign_ticket(self.tickets[0])]
+        self.client.force_login(create_customer('customer@example.com'))
+        self.assertEqual(self.board(codes).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.board(codes).status_code, 403)
+        self.assertFalse(Ticket.objects.filter(gate_manager__isnull=False).exists())
+        self.assertEqual(SeatInventory.objects.get(flight=self.flight, seat_class='economy').boarded, 0)
+
+    def test_unknown_flight(self):
+        response = self.client.post(reverse('customer_interface:boarding', args=[0]),
+                                    {'tickets': [sign_ticket(self.tickets[0])]}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
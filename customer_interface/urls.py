@@ -15,9 +15,12 @@ urlpatterns = [
     path('ticket_input/', views.ticket_input, name='ticket_input'),
     path('ticket_detail/<int:ticket_id>/', views.ticket_detail, name='ticket_detail'),
     path('ticket_gate/', views.ticket_gate, name='ticket_gate'),
+    path('ticket_pdf/<int:ticket_id>/', views.ticket_pdf, name='ticket_pdf'),
     path('create_flight/', views.CreateFlightView.as_view(), name='create_flight'),
     path('users_list/', views.UsersList.as_view(), name='users_list'),
     path('save_user_groups/', views.SaveUserGroupsView.as_view(), name='save_user_groups'),
     path('flight_stats/<int:pk>/', views.flight_stats, name='flight_stats'),
+    path('metrics/', views.metrics, name='metrics'),
     path('api/v1/wayforpay_callback/', views.WayForPayCallback.as_view(), name='wayforpay_callback'),
+    path('api/v1/flights/<int:flight_id>/boarding/', views.BoardingView.as_view(), name='boarding'),
 ]
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.utils import timezone
+
+from customer_interface.models import SeatInventory, Ticket
+from customer_interface.utils.ticket_codes import read_ticket_code
+
+BOARDED = 'boarded'
+ALREADY_BOARDED = 'already_boarded'
+DUPLICATE = 'duplicate'
+INVALID_CODE = 'invalid_code'
+NOT_FOUND = 'not_found'
+WRONG_FLIGHT = 'wrong_flight'
+NOT_PAID = 'not_paid'
+
+# What the gate page tells the gate manager for a ticket which was not boarded
+RESULT_MESSAGES = {
+    ALREADY_BOARDED: 'The ticket has already been boarded',
+    DUPLICATE: 'The ticket was scanned twice',
+    INVALID_CODE: 'Scan the QR code of the ticket',
+    NOT_FOUND: 'The ticket does not exist',
+    WRONG_FLIGHT: 'The ticket belongs to another flight',
+    NOT_PAID: 'The ticket is not paid',
+}
+
+
+def board_tickets(flight, codes, gate_manager):
+    """
+    Boards the scanned tickets of the flight. The tickets are validated with one query and boarded
+    with one UPDATE, the boarded counter of the seat inventory is moved in the same transaction.
+    This is the only way tickets are boarded, the gate page and the bulk API both go through it.
+
+    Args:
+        flight (Flight): the flight being boarded.
+        codes (list): scanned QR payloads. Typed ticket ids are not signed and are only accepted at the
+            check-in desk, here they are invalid codes.
+        gate_manager: the user who boards the tickets.
+
+    Returns:
+        dict: a result per code, in the order of the codes, and the boarded and remaining counts of the flight.
+    """
+    results = []
+    seen = set()
+    for code in codes:
+        try:
+            ticket_id, flight_id = read_ticket_code(code, typed_ids=False)
+        except ValueError:
+            results.append({'code': code, 'ticket_id': None, 'result': INVALID_CODE})
+            continue
+        if ticket_id in seen:
+            result = DUPLICATE
+        elif flight_id != flight.pk:
+            # The signed payload tells the flight, no lookup is needed
+            result = WRONG_FLIGHT
+        else:
+            result = None
+        seen.add(ticket_id)
+        results.append({'code': code, 'ticket_id': ticket_id, 'result': result})
+
+    pending = [result for result in results if result['result'] is None]
+    rows = {
+        ticket_id: (flight_id, status, gate_manager_id)
+        for ticket_id, flight_id, status, gate_manager_id in Ticket.objects.filter(
+            id__in=[result['ticket_id'] for result in pending]
+        ).values_list('id', 'flight_id', 'status', 'gate_manager_id')
+    } if pending else {}
+
+    boardable = []
+    for result in pending:
+        row = rows.get(result['ticket_id'])
+        if row is None:
+            result['result'] = NOT_FOUND
+        elif row[0] != flight.pk:
+            result['result'] = WRONG_FLIGHT
+        elif row[1] != 'checked_out':
+            result['result'] = NOT_PAID
+        elif row[2] is not None:
+            result['result'] = ALREADY_BOARDED
+        else:
+            boardable.append(result)
+
+    with transaction.atomic():
+        if boardable:
+            # The guard of the UPDATE skips tickets boarded by another gate since the validation
+            boarded = {ticket_id for ticket_id, _status in SeatInventory.update_tickets(
+                Ticket.objects.filter(id__in=[result['ticket_id'] for result in boardable], flight=flight,
+                                      status='checked_out', gate_manager__isnull=True),
+                gate_manager=gate_manager, time_gate=timezone.now(),
+            )}
+            for result in boardable:
+                result['result'] = BOARDED if result['ticket_id'] in boarded else ALREADY_BOARDED
+        inventories = SeatInventory.for_flight(flight).values()
+
+    boarded_count = sum(inventory.boarded for inventory in inventories)
+    return {
+        'flight_id': flight.pk,
+        'results': results,
+        'boarded': boarded_count,
+        'remaining': sum(inventory.sold for inventory in inventories) - boarded_count,
+    }
@@ -0,0 +1,73 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from customer_interface.models import Basket, BasketNotification, Flight, SeatInventory, Ticket, TicketFacilities
+from customer_interface.utils.ticket_states import transition_one
+
+
+def claim_available_ticket(flight, seat_class, basket):
+    """
+    Gives an expired ('available') ticket of the flight to the basket instead of deleting it and inserting a new one.
+    The candidate is read with its basket and whether it has facilities, then taken with one conditional UPDATE;
+    the user who lost it gets a basket notification.
+
+    Returns:
+        Ticket or None: the claimed ticket, None if there is no available ticket.
+    """
+    candidate = Ticket.objects.filter(
+        flight=flight, seat_class=seat_class, status='available'
+    ).annotate(
+        has_facilities=Exists(TicketFacilities.objects.filter(ticket=OuterRef('pk')))
+    ).values_list(*SeatInventory.TICKET_STATE, 'basket', 'has_facilities').first()
+    if candidate is None:
+        return None
+    row, (basket_overdue_id, has_facilities) = candidate[:-2], candidate[-2:]
+    ticket_id = row[0]
+
+    now = timezone.now()
+    # The seat of the ticket is released and the new hold counted in the same transition
+    if not transition_one(row, 'booked', created_at=now, order=None, seat_number=None, first_name=None,
+                          last_name=None):
+        return None
+
+    if has_facilities:
+        TicketFacilities.objects.filter(ticket_id=ticket_id).delete()
+
+    BasketTickets = Basket.tickets.through
+    if basket_overdue_id is None:
+        BasketTickets.objects.create(ticket_id=ticket_id, basket_id=basket.pk)
+    elif basket_overdue_id != basket.pk:
+        BasketNotification.objects.create(
+            basket_id=basket_overdue_id,
+            message=f'Due to the fact that you did not buy the ticket within 30 minutes and it was bought by another user we have removed Flight: {flight} Seat: {seat_class} from your cart.',
+        )
+        BasketTickets.objects.filter(ticket_id=ticket_id).update(basket_id=basket.pk)
+    # A ticket reclaimed by the basket it expired in is already there and nobody lost it
+
+    ticket = Ticket(pk=ticket_id, flight=flight, seat_class=seat_class, status='booked', created_at=now)
+    ticket._state.adding = False
+    ticket._loaded_seat = ticket.seat_key()
+    ticket._loaded_counters = ticket.counter_key()
+    return ticket
+
+
+def book_ticket(flight_id, seat_class, basket):
+    """
+    Books a ticket of the seat class on the flight and adds it to the basket.
+
+    The flight row is locked with SELECT ... FOR UPDATE until the transaction ends, so concurrent
+    bookings of one flight are checked against the capacity one after another and the last seat
+    can not be sold twice. The remaining capacity is a single-row read of the seat inventory counters.
+    """
+    with transaction.atomic():
+        flight = Flight.objects.select_for_update().get(pk=flight_id)
+        if SeatInventory.for_flight(flight)[seat_class].remaining() <= 0:
+            raise ValidationError('This flight full')
+
+        ticket = claim_available_ticket(flight, seat_class, basket)
+        if ticket is None:
+            ticket = Ticket.objects.create(flight=flight, seat_class=seat_class)
+            basket.tickets.add(ticket)
+    return ticket
@@ -0,0 +1,79 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from customer_interface.models import Flight, FlightFacilities, SeatInventory
+from customer_interface.signals import seat_inventory_changed
+
+CACHE_TIMEOUT = 60 * 10
+
+
+def shared_cache():
+    return caches['shared']
+
+
+def flight_key(flight_id):
+    return f'flight:{flight_id}'
+
+
+def facilities_key(flight_id):
+    return f'flight_facilities:{flight_id}'
+
+
+def free_seats_key(flight_id):
+    return f'flight_free_seats:{flight_id}'
+
+
+def cached_flight(flight_id):
+    """Returns the flight with its airplane, read from the shared cache when possible."""
+    flight = shared_cache().get(flight_key(flight_id))
+    if flight is None:
+        flight = Flight.objects.select_related('airplane').get(pk=flight_id)
+        shared_cache().set(flight_key(flight_id), flight, CACHE_TIMEOUT)
+    return flight
+
+
+def cached_facilities_for_flight(flight_id):
+    """Returns the list of FlightFacilities (with Facilities) of the flight."""
+    facilities = shared_cache().get(facilities_key(flight_id))
+    if facilities is None:
+        facilities = list(FlightFacilities.objects.filter(flight_id=flight_id).select_related('facilities'))
+        shared_cache().set(facilities_key(flight_id), facilities, CACHE_TIMEOUT)
+    return facilities
+
+
+def cached_free_seats(flight):
+    """Returns (free economy seats, free business seats) of the flight."""
+    free_seats = shared_cache().get(free_seats_key(flight.pk))
+    if free_seats is None:
+        inventories = SeatInventory.for_flight(flight)
+        free_seats = inventories['economy'].free_seats(), inventories['business'].free_seats()
+        shared_cache().set(free_seats_key(flight.pk), free_seats, CACHE_TIMEOUT)
+    return free_seats
+
+
+def delete_on_commit(*keys):
+    """
+    Deletes the keys once the current transaction commits. Deleted earlier, a concurrent reader
+    could cache the rows as they were before the commit again for CACHE_TIMEOUT.
+    """
+    transaction.on_commit(lambda: shared_cache().delete_many(list(keys)))
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_flight(sender, instance, **kwargs):
+    delete_on_commit(flight_key(instance.pk), facilities_key(instance.pk), free_seats_key(instance.pk))
+
+
+@receiver(post_save, sender=FlightFacilities)
+@receiver(post_delete, sender=FlightFacilities)
+def invalidate_flight_facilities(sender, instance, **kwargs):
+    delete_on_commit(facilities_key(instance.flight_id))
+
+
+@receiver(seat_inventory_changed)
+def invalidate_free_seats(sender, flight_id, seat_class, **kwargs):
+    # Ticket saves, deletes and bulk seat changes all end up in SeatInventory.apply() or rebuild()
+    delete_on_commit(free_seats_key(flight_id))
@@ -0,0 +1,70 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def normalize_place(value):
+    """Lowercase a city/airport name and collapse whitespace so it can be matched by prefix."""
+    return ' '.join((value or '').split()).casefold()
+
+
+def prefix_filter(field_name, value):
+    """
+    Match rows whose field starts with the value. The LIKE 'value%' condition is answered from
+    the varchar_pattern_ops index of the field on PostgreSQL, whatever the collation of the database.
+    Only the start of the name is matched: "york" does not find "New York".
+    """
+    return Q(**{f'{field_name}__startswith': normalize_place(value)})
+
+
+def search_flights(queryset, place_of_departure=None, place_of_arrival=None, departure_from=None, departure_to=None):
+    """
+    Applies the search filters to the flight queryset and sorts it by departure time.
+    """
+    if place_of_departure:
+        queryset = queryset.filter(prefix_filter('departure_search', place_of_departure))
+    if place_of_arrival:
+        queryset = queryset.filter(prefix_filter('arrival_search', place_of_arrival))
+    if departure_from:
+        queryset = queryset.filter(
+            date_time_of_departure__gte=timezone.make_aware(datetime.combine(departure_from, time.min)),
+        )
+    if departure_to:
+        queryset = queryset.filter(
+            date_time_of_departure__lt=timezone.make_aware(datetime.combine(departure_to + timedelta(days=1), time.min)),
+        )
+    return queryset.order_by('date_time_of_departure', 'id')
+
+
+def encode_cursor(flight):
+    microseconds = (flight.date_time_of_departure - EPOCH) // timedelta(microseconds=1)
+    return f'{microseconds}-{flight.pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        # The microseconds are negative before 1970, only the last dash separates the id
+        microseconds, pk = cursor.rsplit('-', 1)
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    Returns one page of flights that follow the cursor and the cursor of the next page.
+    The queryset must be ordered by (date_time_of_departure, id).
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded:
+        departure, pk = decoded
+        queryset = queryset.filter(
+            Q(date_time_of_departure__gt=departure) | Q(date_time_of_departure=departure, id__gt=pk)
+        )
+
+    flights = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(flights[page_size - 1]) if len(flights) > page_size else None
+    return flights[:page_size], next_cursor
@@ -0,0 +1,102 @@
+import logging
+import threading
+from smtplib import SMTPException
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the message is worth sending again (the Celery tasks retry them with backoff)
+RETRY_EXCEPTIONS = (SMTPException, OSError)
+
+_local = threading.local()
+
+# Only Celery workers keep their connection open; set when a worker (or a prefork child of it) starts
+_persistent = False
+
+
+def get_worker_connection():
+    """
+    Returns the mail connection of the current worker, opening it on first use.
+    The connection stays open between tasks, so the SMTP/TLS handshake is done once per worker.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = get_connection()
+        _local.connection = connection
+    connection.open()  # Does nothing when the connection is already open
+    return connection
+
+
+def close_worker_connection():
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except RETRY_EXCEPTIONS:
+            pass
+
+
+class DeliveryFailed(SMTPException):
+    """The connection failed in the middle of a batch; unsent holds the messages which were not sent, in order."""
+
+    def __init__(self, unsent):
+        super().__init__(f'{len(unsent)} messages were not sent')
+        self.unsent = unsent
+
+
+def send_each(connection, messages):
+    """
+    Sends the messages one by one over the open connection, so a failure tells which of them went out.
+
+    Returns:
+        int: number of sent messages.
+
+    Raises:
+        DeliveryFailed: when the connection fails, with the failed message and the ones after it.
+    """
+    sent = 0
+    for index, message in enumerate(messages):
+        try:
+            sent += connection.send_messages([message])
+        except RETRY_EXCEPTIONS as error:
+            raise DeliveryFailed(messages[index:]) from error
+    return sent
+
+
+def deliver(messages):
+    """
+    Sends the messages over one connection. In a Celery worker they go over the worker connection, and
+    a connection dropped by the server while idle is reopened once to send the messages which did not
+    go out yet, so nobody gets a message twice. Other processes (the web server sending a registration
+    email) open a connection for the call.
+
+    Returns:
+        int: number of sent messages.
+
+    Raises:
+        DeliveryFailed: with the messages which were not sent.
+    """
+    if not _persistent:
+        with get_connection() as connection:
+            return send_each(connection, messages)
+    try:
+        return send_each(get_worker_connection(), messages)
+    except DeliveryFailed as error:
+        logger.warning('Mail connection failed, reconnecting', exc_info=True)
+        close_worker_connection()
+        return len(messages) - len(error.unsent) + send_each(get_worker_connection(), error.unsent)
+
+
+@worker_init.connect
+@worker_process_init.connect
+def keep_connections_open(**kwargs):
+    global _persistent
+    _persistent = True
+
+
+@worker_process_shutdown.connect
+def close_connection_on_shutdown(**kwargs):
+    close_worker_connection()
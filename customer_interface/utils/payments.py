@@ -0,0 +1,176 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+
+from customer_interface.utils.wayforpay import decode_order_reference, encode_order_reference, generate_hmac, \
+    create_check_status_params, send_request, SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+# WayForPay reasonCode of an approved payment
+APPROVED_CODE = 1100
+
+
+def parse_callback(request):
+    """
+    Returns the callback payload as a dict.
+    WayForPay posts the JSON document as the request body, which form parsers turn into a single dict key,
+    so both a parsed JSON body and the JSON-in-key form are accepted. The body itself can not be read
+    again here, DRF has already consumed the stream.
+
+    Raises:
+        ValueError: when the payload is not a JSON object with an orderReference.
+    """
+    data = request.data
+    if isinstance(data, dict) and 'orderReference' not in data:
+        data = json.loads(next(iter(data.keys()), ''))
+    if not isinstance(data, dict) or not isinstance(data.get('orderReference'), str):
+        raise ValueError('Callback without orderReference')
+    return data
+
+
+def mark_order_paid(order_reference, reason_code=APPROVED_CODE):
+    """
+    Checks out all tickets of the paid order once per orderReference.
+    The processed reference is inserted first: a duplicate callback hits the unique constraint and changes nothing.
+    The ticket delivery is enqueued after the commit, as one task for the whole order.
+
+    Returns:
+        bool: True if the payment was applied now, False if it had already been processed.
+    """
+    from customer_interface.models import ProcessedPayment
+
+    order_id = decode_order_reference(order_reference)
+    try:
+        with transaction.atomic():
+            ProcessedPayment.objects.create(order_reference=order_reference, order_id=order_id,
+                                            reason_code=reason_code)
+            _check_out_orders([order_id])
+    except IntegrityError:
+        # A duplicate reference, or a reference of an order which does not exist
+        logger.info('Payment %s was not applied: already processed or unknown order', order_reference)
+        return False
+    return True
+
+
+def mark_orders_paid(order_references):
+    """
+    Applies several approved payments with one INSERT and one UPDATE.
+    If a callback processed one of them meanwhile, the batch is applied one by one instead.
+
+    Returns:
+        int: number of payments applied now.
+    """
+    from customer_interface.models import ProcessedPayment
+
+    order_ids = {reference: decode_order_reference(reference) for reference in order_references}
+    try:
+        with transaction.atomic():
+            ProcessedPayment.objects.bulk_create([
+                ProcessedPayment(order_reference=reference, order_id=order_id, reason_code=APPROVED_CODE)
+                for reference, order_id in order_ids.items()
+            ])
+            _check_out_orders(order_ids.values())
+    except IntegrityError:
+        return sum(mark_order_paid(reference) for reference in order_ids)
+    return len(order_ids)
+
+
+def _check_out_orders(order_ids):
+    from customer_interface.models import Ticket
+    from customer_interface.tasks import deliver_order_tickets
+    from customer_interface.utils.ticket_states import transition_many
+
+    order_ids = list(order_ids)
+    transition_many(Ticket.objects.filter(order_id__in=order_ids).values('id'), ('booked', 'available'), 'checked_out')
+    for order_id in order_ids:
+        transaction.on_commit(lambda order_id=order_id: deliver_order_tickets.delay(order_id))
+
+
+def pending_order_ids():
+    """
+    Orders that were placed but have not been paid according to our records.
+    Only orders older than WAYFORPAY_RECONCILE_AFTER (the callback had its chance) and younger than the
+    invoice timeout are checked, at most WAYFORPAY_RECONCILE_BATCH of them per run.
+    """
+    from customer_interface.models import Order
+
+    now = timezone.now()
+    return list(
+        Order.objects.filter(
+            created_order__gte=now - settings.WAYFORPAY_INVOICE_TIMEOUT,
+            created_order__lt=now - settings.WAYFORPAY_RECONCILE_AFTER,
+            payments__isnull=True,
+            tickets__isnull=False,
+        ).distinct().order_by('id').values_list('id', flat=True)[:settings.WAYFORPAY_RECONCILE_BATCH]
+    )
+
+
+def check_status(order_id):
+    """
+    Asks the gateway for the status of the order's invoice.
+
+    Returns:
+        dict: the gateway answer, or None when the gateway could not be reached or its answer is not a JSON object.
+    """
+    try:
+        response = send_request(create_check_status_params(order_id))
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, dict):
+            raise ValueError('CHECK_STATUS answer is not a JSON object')
+        return data
+    except (requests.RequestException, ValueError):
+        logger.warning('CHECK_STATUS for order %s failed', order_id, exc_info=True)
+        return None
+
+
+def reconcile_pending_orders():
+    """
+    Polls CHECK_STATUS for pending orders with WAYFORPAY_RECONCILE_WORKERS requests in flight
+    and checks out all approved orders at once.
+
+    Returns:
+        int: number of orders checked out.
+    """
+    order_ids = pending_order_ids()
+    if not order_ids:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=settings.WAYFORPAY_RECONCILE_WORKERS) as executor:
+        results = executor.map(check_status, order_ids)
+        approved = [
+            encode_order_reference(order_id)
+            for order_id, result in zip(order_ids, results)
+            if result is not None and is_approved(result)
+        ]
+    return mark_orders_paid(approved) if approved else 0
+
+
+def accept_response(order_reference):
+    """Signed answer which tells WayForPay that the callback was received."""
+    response_data = {
+        "orderReference": order_reference,
+        "status": "accept",
+        "time": int(time.time()),
+    }
+    data_to_sign = [
+        response_data["orderReference"],
+        response_data["status"],
+        str(response_data["time"]),
+    ]
+    response_data["signature"] = generate_hmac(data_to_sign, SECRET_KEY)
+    return response_data
+
+
+def is_approved(data):
+    try:
+        return int(data.get('reasonCode')) == APPROVED_CODE
+    except (TypeError, ValueError):
+        return False
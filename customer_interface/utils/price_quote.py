@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from customer_interface.models import Flight, FlightFacilities
+
+
+class PriceQuote:
+    """
+    Ticket prices keyed by (flight_id, seat_class, seat_selected, frozenset(facility_ids)).
+
+    Quotes are kept in an in-process LRU and, when settings.PRICE_QUOTE_CACHE names a cache alias,
+    in that shared cache as well. Every flight has a version in the shared cache which is replaced
+    after the flight or its facilities are saved. A worker remembers the versions it has read for
+    settings.PRICE_QUOTE_VERSION_TTL seconds, so a price changed in another process is served at
+    most that long and a local hit does not read the shared cache.
+    """
+
+    def __init__(self, maxsize=1024, timeout=3600):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._quotes = OrderedDict()
+        # flight_id -> (version, time.monotonic() when it was read)
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, 'PRICE_QUOTE_CACHE', None)
+        return caches[alias] if alias else None
+
+    @property
+    def version_ttl(self):
+        return getattr(settings, 'PRICE_QUOTE_VERSION_TTL', 5)
+
+    @staticmethod
+    def make_key(flight_id, seat_class, seat_selected=False, facility_ids=()):
+        facility_ids = frozenset(int(facility_id) for facility_id in facility_ids)
+        return int(flight_id), seat_class, bool(seat_selected), facility_ids
+
+    def get(self, flight_id, seat_class, seat_selected=False, facility_ids=()):
+        """Returns the price of a ticket: base class price, seat selection surcharge and facilities."""
+        key = self.make_key(flight_id, seat_class, seat_selected, facility_ids)
+        version = self._version(key[0])
+
+        with self._lock:
+            cached = self._quotes.get(key)
+            if cached and cached[0] == version:
+                self._quotes.move_to_end(key)
+                return cached[1]
+
+        shared_cache = self.shared_cache
+        shared_key = self._shared_key(key, version)
+        price = shared_cache.get(shared_key) if shared_cache else None
+        if price is None:
+            price = self.compute(*key)
+            if shared_cache:
+                shared_cache.set(shared_key, price, self.timeout)
+
+        with self._lock:
+            self._quotes[key] = (version, price)
+            self._quotes.move_to_end(key)
+            while len(self._quotes) > self.maxsize:
+                self._quotes.popitem(last=False)
+        return price
+
+    def surcharge(self, flight_id, seat_class, seat_selected=False, facility_ids=()):
+        """Returns the price of the extras only (seat selection and facilities), without the base price."""
+        return (self.get(flight_id, seat_class, seat_selected, facility_ids)
+                - self.get(flight_id, seat_class))
+
+    @staticmethod
+    def compute(flight_id, seat_class, seat_selected, facility_ids):
+        flight = Flight.objects.values(
+            'price_economy_seats', 'price_business_seats', 'price_number_economy_seats', 'price_number_business_seats'
+        ).get(pk=flight_id)
+        price = flight[f'price_{seat_class}_seats']
+        if seat_selected:
+            price += flight[f'price_number_{seat_class}_seats']
+        if facility_ids:
+            price += FlightFacilities.objects.filter(
+                flight_id=flight_id, pk__in=facility_ids
+            ).aggregate(total=Sum('price'))['total'] or 0
+        return price
+
+    def invalidate(self, flight_id):
+        """Drops the quotes of the flight. Call it after the commit of the change, see invalidate_on_commit()."""
+        with self._lock:
+            for key in [key for key in self._quotes if key[0] == flight_id]:
+                del self._quotes[key]
+            self._versions.pop(flight_id, None)
+        shared_cache = self.shared_cache
+        if shared_cache:
+            shared_cache.set(self._version_key(flight_id), time.time_ns(), None)
+
+    def invalidate_on_commit(self, flight_id):
+        """
+        Invalidates the quotes once the current transaction commits. Before that a concurrent
+        request still reads the old price and would cache it again under the new version.
+        """
+        transaction.on_commit(lambda: self.invalidate(flight_id))
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+            self._versions.clear()
+
+    def _version(self, flight_id):
+        shared_cache = self.shared_cache
+        if shared_cache is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            remembered = self._versions.get(flight_id)
+        if remembered and now - remembered[1] < self.version_ttl:
+            return remembered[0]
+
+        version = shared_cache.get_or_set(self._version_key(flight_id), time.time_ns, None)
+        with self._lock:
+            self._versions[flight_id] = (version, now)
+            self._versions.move_to_end(flight_id)
+            while len(self._versions) > self.maxsize:
+                self._versions.popitem(last=False)
+        return version
+
+    @staticmethod
+    def _version_key(flight_id):
+        return f'price_quote_version:{flight_id}'
+
+    @staticmethod
+    def _shared_key(key, version):
+        flight_id, seat_class, seat_selected, facility_ids = key
+        facilities = ','.join(str(facility_id) for facility_id in sorted(facility_ids))
+        return f'price_quote:{flight_id}:{version}:{seat_class}:{int(seat_selected)}:{facilities}'
+
+
+price_quotes = PriceQuote()
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_flight_quotes(sender, instance, **kwargs):
+    price_quotes.invalidate_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=FlightFacilities)
+@receiver(post_delete, sender=FlightFacilities)
+def invalidate_facilities_quotes(sender, instance, **kwargs):
+    price_quotes.invalidate_on_commit(instance.flight_id)
@@ -0,0 +1,116 @@
+import re
+import threading
+from collections import defaultdict
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def sql_shape(sql):
+    """
+    The statement without its varying parts. Parameters are already placeholders,
+    only IN lists of different lengths have to be collapsed.
+    """
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryCollector:
+    """
+    Database execute wrapper which counts the queries of one request, their time and repeated SQL shapes.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = self.clock()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += self.clock() - started
+            self.count += 1
+            self.shapes[sql] += 1
+
+    def repeated_shapes(self, threshold):
+        """SQL shapes executed at least `threshold` times, the usual sign of an N+1 query."""
+        counts = defaultdict(int)
+        for sql, count in self.shapes.items():
+            counts[sql_shape(sql)] += count
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+
+class ViewMetrics:
+    __slots__ = ('requests', 'duration', 'buckets', 'queries', 'sql_duration', 'n_plus_one')
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.sql_duration = 0.0
+        self.n_plus_one = 0
+
+
+class QueryMetrics:
+    """Aggregates of all requests served by this process, per view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+
+    def observe(self, view, duration, queries, sql_duration, n_plus_one):
+        with self.lock:
+            metrics = self.views[view]
+            metrics.requests += 1
+            metrics.duration += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[index] += 1
+                    break
+            metrics.queries += queries
+            metrics.sql_duration += sql_duration
+            metrics.n_plus_one += n_plus_one
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """The aggregates in the Prometheus text exposition format."""
+        with self.lock:
+            views = sorted(self.views.items())
+            snapshot = [(view, metrics.requests, metrics.duration, list(metrics.buckets), metrics.queries,
+                         metrics.sql_duration, metrics.n_plus_one) for view, metrics in views]
+
+        lines = [
+            '# HELP django_view_duration_seconds Wall time of the requests.',
+            '# TYPE django_view_duration_seconds histogram',
+        ]
+        for view, requests, duration, buckets, _queries, _sql_duration, _n_plus_one in snapshot:
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'django_view_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'django_view_duration_seconds_bucket{{view="{view}",le="+Inf"}} {requests}')
+            lines.append(f'django_view_duration_seconds_sum{{view="{view}"}} {duration}')
+            lines.append(f'django_view_duration_seconds_count{{view="{view}"}} {requests}')
+
+        counters = (
+            ('django_view_sql_queries_total', 'SQL queries executed by the requests.', 4),
+            ('django_view_sql_duration_seconds_total', 'Time spent in SQL queries.', 5),
+            ('django_view_n_plus_one_total', 'Requests with repeated identical SQL shapes.', 6),
+        )
+        for name, help_text, position in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for row in snapshot:
+                lines.append(f'{name}{{view="{row[0]}"}} {row[position]}')
+        return '\n'.join(lines) + '\n'
+
+
+query_metrics = QueryMetrics()
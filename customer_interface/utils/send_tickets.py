@@ -1,59 +1,54 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from django.conf import settings
 from django.core.mail import EmailMessage
-import segno
 
+from customer_interface.utils.mailer import deliver
+from customer_interface.utils.ticket_artifacts import ticket_artifact, order_artifact, read_artifact
 
-def create_ticket_pdf(ticket):
-    pdf_path = f'ticket_{ticket.id}.pdf'
-    c = canvas.Canvas(pdf_path, pagesize=letter)
 
-    qr_code = segno.make(f'Ticket ID: {ticket.id}')
-    qr_code_path = 'qr_code.png'  # Path to save the QR code image
-    qr_code.save(qr_code_path)
-
-    c.drawInlineImage(qr_code_path, x=400, y=675, width=100, height=100)
-
-    flight_info = f'Flight: {ticket.flight.place_of_departure} - {ticket.flight.place_of_arrival}'
-    c.drawString(45, 750, flight_info)
-
-    flight_info_d = f'Date and Time of Departure: {ticket.flight.date_time_of_departure}'
-    c.drawString(45, 720, flight_info_d)
-
-    flight_info_a = f'Date and Time of Arrival: {ticket.flight.date_time_of_arrival}'
-    c.drawString(45, 690, flight_info_a)
+def build_ticket_email(ticket, email):
+    pdf = read_artifact(*ticket_artifact(ticket))
+    subject = 'Your flight ticket'
+    message = 'Thank you for using our airline company.'
+    email_from = settings.EMAIL_HOST_USER
+    recipient_list = [email]
 
-    passenger_info = f'Passenger: {ticket.first_name} {ticket.last_name}'
-    c.drawString(45, 660, passenger_info)
+    email = EmailMessage(subject, message, email_from, recipient_list)
+    email.attach(f'ticket_{ticket.id}.pdf', pdf, 'application/pdf')
+    return email
 
-    seat_info = f'Seat class: {ticket.seat_class}'
-    c.drawString(45, 630, seat_info)
 
-    y_offset = 600
+def send_ticket_email(ticket, email):
+    deliver([build_ticket_email(ticket, email)])
 
-    if ticket.seat_number:
-        c.drawString(45, y_offset, f'Seat number: {ticket.seat_number}')
-        y_offset -= 30
 
-    facilities_list = ticket.flight_facilities.all()
-    if facilities_list:
-        for facility in facilities_list:
-            facilities_info = f'Facilities: {facility.facilities.facilities_name}'
-            c.drawString(45, y_offset, facilities_info)
-            y_offset -= 30
+def send_ticket_emails(tickets, email):
+    """Sends an email per ticket, all of them in one batch over one connection."""
+    deliver([build_ticket_email(ticket, email) for ticket in tickets])
 
-    c.save()
-    return pdf_path
 
+def build_order_tickets_email(order_id, tickets, email, single_pdf=True):
+    """
+    Builds one email with all tickets of an order.
 
-def send_ticket_email(ticket, email):
-    pdf_path = create_ticket_pdf(ticket)
-    subject = 'Your flight ticket'
+    Args:
+        order_id (int): The order the tickets belong to.
+        tickets (list): Tickets with flight and facilities already loaded.
+        email (str): Recipient address.
+        single_pdf (bool): Attach one multi-page PDF instead of a PDF per ticket.
+    """
+    subject = 'Your flight tickets'
     message = 'Thank you for using our airline company.'
     email_from = settings.EMAIL_HOST_USER
     recipient_list = [email]
 
     email = EmailMessage(subject, message, email_from, recipient_list)
-    email.attach_file(pdf_path)
-    email.send()
+    if single_pdf:
+        email.attach(f'order_{order_id}_tickets.pdf', read_artifact(*order_artifact(tickets)), 'application/pdf')
+    else:
+        for ticket in tickets:
+            email.attach(f'ticket_{ticket.id}.pdf', read_artifact(*ticket_artifact(ticket)), 'application/pdf')
+    return email
+
+
+def send_order_tickets_email(order_id, tickets, email, single_pdf=True):
+    deliver([build_order_tickets_email(order_id, tickets, email, single_pdf)])
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from customer_interface.utils.flight_search import normalize_place
+
+CITIES = (
+    'Kyiv', 'Lviv', 'Odesa', 'Kharkiv', 'Dnipro', 'Warsaw', 'Krakow', 'Berlin', 'Munich', 'Vienna',
+    'Prague', 'Budapest', 'Paris', 'Rome', 'Madrid', 'Lisbon', 'London', 'Dublin', 'Oslo', 'Helsinki',
+)
+
+# Share of the sold seats by ticket status
+STATUS_WEIGHTS = (('checked_out', 0.7), ('booked', 0.2), ('available', 0.1))
+
+
+def seed_flights(count, rng, fill=0.8, batch_size=5000):
+    """
+    Creates flights on airplanes with the maximum 60 economy and 25 business seats, their facilities,
+    tickets for `fill` of the seats and the matching seat inventories with their counters. Everything is inserted with bulk_create.
+
+    Args:
+        count (int): number of flights.
+        rng (random.Random): source of randomness, seeded by the caller for reproducible datasets.
+        fill (float): share of the seats of every class which get a ticket.
+
+    Returns:
+        list: ids of the created flights.
+    """
+    from customer_interface.models import Airplane, Facilities, Flight, FlightFacilities, Ticket, SeatInventory
+
+    airplane = Airplane.objects.create(economy_seats=60, business_seats=25)
+    facilities = [Facilities.objects.get_or_create(facilities_name=name)[0] for name in ('lunch', 'luggage')]
+
+    now = timezone.now()
+    flights = []
+    for _number in range(count):
+        departure, arrival = rng.sample(CITIES, 2)
+        date_time_of_departure = now + timedelta(minutes=rng.randrange(60, 90 * 24 * 60))
+        flights.append(Flight(
+            date_time_of_departure=date_time_of_departure,
+            date_time_of_arrival=date_time_of_departure + timedelta(minutes=rng.randrange(60, 300)),
+            place_of_departure=departure,
+            place_of_arrival=arrival,
+            departure_search=normalize_place(departure),
+            arrival_search=normalize_place(arrival),
+            airplane=airplane,
+            available_economy_seats=airplane.economy_seats,
+            available_business_seats=airplane.business_seats,
+            price_economy_seats=rng.randrange(1000, 5000),
+            price_business_seats=rng.randrange(5000, 15000),
+            price_number_economy_seats=rng.randrange(50, 200),
+            price_number_business_seats=rng.randrange(100, 400),
+        ))
+    flights = Flight.objects.bulk_create(flights, batch_size=batch_size)
+
+    FlightFacilities.objects.bulk_create([
+        FlightFacilities(flight=flight, facilities=facility, price=rng.randrange(100, 500))
+        for flight in flights for facility in facilities
+    ], batch_size=batch_size)
+
+    statuses = [status for status, _weight in STATUS_WEIGHTS]
+    weights = [weight for _status, weight in STATUS_WEIGHTS]
+    tickets = []
+    inventories = []
+    for flight in flights:
+        for seat_class, capacity in (('economy', flight.available_economy_seats),
+                                     ('business', flight.available_business_seats)):
+            inventory = SeatInventory(flight=flight, seat_class=seat_class)
+            for seat_number in rng.sample(range(1, capacity + 1), round(capacity * fill)):
+                ticket = Ticket(flight=flight, seat_class=seat_class, seat_number=seat_number,
+                                status=rng.choices(statuses, weights)[0],
+                                first_name='Passenger', last_name=str(seat_number))
+                inventory.occupied |= SeatInventory.seat_mask(seat_number)
+                for counter in SeatInventory.counted_as(ticket.counter_key()):
+                    setattr(inventory, counter, getattr(inventory, counter) + 1)
+                tickets.append(ticket)
+            inventories.append(inventory)
+        if len(tickets) >= batch_size:
+            Ticket.objects.bulk_create(tickets, batch_size=batch_size)
+            tickets = []
+    Ticket.objects.bulk_create(tickets, batch_size=batch_size)
+    SeatInventory.objects.bulk_create(inventories, batch_size=batch_size)
+
+    return [flight.id for flight in flights]
+
+
+def create_customer(email, is_superuser=False):
+    """Creates a user with a basket, without hashing a password."""
+    from customer_interface.models import Basket
+
+    user = get_user_model()(email=email, is_superuser=is_superuser, is_staff=is_superuser)
+    user.set_unusable_password()
+    user.save()
+    Basket.objects.get_or_create(user=user)
+    return user
+
+
+def seed_order(user, flight_ids, rng, tickets=2):
+    """Creates an order of the user with booked tickets without selected seats on random flights."""
+    from customer_interface.models import Order, Ticket
+
+    order = Order.objects.create(user=user)
+    Ticket.objects.bulk_create([
+        Ticket(flight_id=rng.choice(flight_ids), seat_class=rng.choice(('economy', 'business')), order=order)
+        for _number in range(tickets)
+    ])
+    return order
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from customer_interface.utils.ticket_pdf import create_ticket_pdf, create_tickets_pdf
+
+# Bump when the PDF layout changes, so old artifacts are not served any more
+RENDER_VERSION = 2
+
+
+def ticket_fingerprint(ticket):
+    """Hash of every ticket field that is printed on the PDF (flight, passenger, seat, facilities)."""
+    data = {
+        'version': RENDER_VERSION,
+        'id': ticket.id,
+        'departure': ticket.flight.place_of_departure,
+        'arrival': ticket.flight.place_of_arrival,
+        'date_time_of_departure': ticket.flight.date_time_of_departure.isoformat(),
+        'date_time_of_arrival': ticket.flight.date_time_of_arrival.isoformat(),
+        'first_name': ticket.first_name,
+        'last_name': ticket.last_name,
+        'seat_class': ticket.seat_class,
+        'seat_number': ticket.seat_number,
+        'facilities': sorted(facility.facilities.facilities_name for facility in ticket.flight_facilities.all()),
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def artifact_path(key):
+    return os.path.join(settings.TICKET_ARTIFACT_DIR, f'{key}.pdf')
+
+
+def get_artifact(key, render):
+    """
+    Returns the path of the cached PDF for the key, rendering and storing it on a miss.
+    The file is written to a temporary name and renamed, so concurrent workers never read a partial file.
+    The path may be evicted before it is opened, open it with open_artifact() to have it rendered again.
+    """
+    path = artifact_path(key)
+    try:
+        os.utime(path)  # Marks the artifact as recently used
+        return path
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(settings.TICKET_ARTIFACT_DIR, exist_ok=True)
+    pdf = render()
+    fd, tmp_path = tempfile.mkstemp(dir=settings.TICKET_ARTIFACT_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(pdf)
+    os.replace(tmp_path, path)
+    return path
+
+
+def evict_artifacts():
+    """
+    Removes the least recently used artifacts until the cache fits into TICKET_ARTIFACT_MAX_BYTES.
+    Scans the whole directory, so it runs periodically (the evict_ticket_artifacts task), not per render.
+
+    Returns:
+        int: number of removed artifacts.
+    """
+    entries = []
+    try:
+        scanned = list(os.scandir(settings.TICKET_ARTIFACT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in scanned:
+        if entry.name.endswith('.pdf'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    removed = 0
+    total_size = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if total_size <= settings.TICKET_ARTIFACT_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total_size -= size
+    return removed
+
+
+def ticket_artifact(ticket):
+    """Key and renderer of the PDF of one ticket."""
+    return ticket_fingerprint(ticket), lambda: create_ticket_pdf(ticket)
+
+
+def order_artifact(tickets):
+    """Key and renderer of the multi-page PDF of the tickets of an order."""
+    key = hashlib.sha256(''.join(ticket_fingerprint(ticket) for ticket in tickets).encode('utf-8')).hexdigest()
+    return key, lambda: create_tickets_pdf(tickets)
+
+
+def ticket_pdf_path(ticket):
+    return get_artifact(*ticket_artifact(ticket))
+
+
+def order_pdf_path(tickets):
+    return get_artifact(*order_artifact(tickets))
+
+
+def open_artifact(key, render):
+    """Opens the cached PDF, rendering it again if it was evicted between get_artifact() and the open."""
+    try:
+        return open(get_artifact(key, render), 'rb')
+    except FileNotFoundError:
+        return open(get_artifact(key, render), 'rb')
+
+
+def read_artifact(key, render):
+    with open_artifact(key, render) as artifact:
+        return artifact.read()
+
+
+def open_ticket_pdf(ticket):
+    """Opens the cached PDF of the ticket for streaming."""
+    return open_artifact(*ticket_artifact(ticket))
@@ -0,0 +1,42 @@
+from collections import namedtuple
+
+from django.core import signing
+
+SALT = 'customer_interface.ticket_code'
+
+TicketCode = namedtuple('TicketCode', ['ticket_id', 'flight_id'])
+
+signer = signing.Signer(salt=SALT)
+
+
+def sign_ticket(ticket):
+    """The payload printed in the QR code of the ticket: its id and flight id with an HMAC signature."""
+    return signer.sign(f'{ticket.id}.{ticket.flight_id}')
+
+
+def read_ticket_code(code, typed_ids=True):
+    """
+    Reads a scanned QR payload or a typed ticket id. The signature is checked without a database hit,
+    so forged or damaged payloads are rejected before any lookup. The signature only protects scanned
+    codes, a typed id is trusted as is, so the callers which can not check it otherwise pass typed_ids=False.
+
+    Args:
+        code (str): the scanned payload or the typed id.
+        typed_ids (bool): whether a typed ticket id is accepted.
+
+    Returns:
+        TicketCode: the ticket id and, for a signed payload, the flight id (None for a typed id).
+
+    Raises:
+        ValueError: if the code is neither a ticket id nor a valid payload, or is a ticket id which is not accepted.
+    """
+    code = (code or '').strip()
+    if code.isdigit():
+        if not typed_ids:
+            raise ValueError('Scan the QR code of the ticket')
+        return TicketCode(int(code), None)
+    try:
+        ticket_id, flight_id = signer.unsign(code).split('.')
+        return TicketCode(int(ticket_id), int(flight_id))
+    except (signing.BadSignature, ValueError):
+        raise ValueError('Invalid ticket code')
@@ -0,0 +1,64 @@
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+import segno
+
+from customer_interface.utils.ticket_codes import sign_ticket
+
+
+def create_qr_code(ticket):
+    buffer = BytesIO()
+    segno.make(sign_ticket(ticket)).save(buffer, kind='png', scale=4)
+    buffer.seek(0)
+    return ImageReader(buffer)
+
+
+def draw_ticket(c, ticket):
+    """Draws the ticket on the current page of the canvas."""
+    c.drawImage(create_qr_code(ticket), x=400, y=675, width=100, height=100)
+
+    flight_info = f'Flight: {ticket.flight.place_of_departure} - {ticket.flight.place_of_arrival}'
+    c.drawString(45, 750, flight_info)
+
+    flight_info_d = f'Date and Time of Departure: {ticket.flight.date_time_of_departure}'
+    c.drawString(45, 720, flight_info_d)
+
+    flight_info_a = f'Date and Time of Arrival: {ticket.flight.date_time_of_arrival}'
+    c.drawString(45, 690, flight_info_a)
+
+    passenger_info = f'Passenger: {ticket.first_name} {ticket.last_name}'
+    c.drawString(45, 660, passenger_info)
+
+    seat_info = f'Seat class: {ticket.seat_class}'
+    c.drawString(45, 630, seat_info)
+
+    y_offset = 600
+
+    if ticket.seat_number:
+        c.drawString(45, y_offset, f'Seat number: {ticket.seat_number}')
+        y_offset -= 30
+
+    facilities_list = ticket.flight_facilities.all()
+    if facilities_list:
+        for facility in facilities_list:
+            facilities_info = f'Facilities: {facility.facilities.facilities_name}'
+            c.drawString(45, y_offset, facilities_info)
+            y_offset -= 30
+
+
+def create_ticket_pdf(ticket):
+    """Renders the ticket into a PDF in memory and returns its bytes."""
+    return create_tickets_pdf([ticket])
+
+
+def create_tickets_pdf(tickets):
+    """Renders the tickets into one PDF, a page per ticket, and returns its bytes."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for ticket in tickets:
+        draw_ticket(c, ticket)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
@@ -1,11 +1,16 @@
-from customer_interface.models import Ticket
+from customer_interface.models import SeatInventory
 
 
 def free_seats(flight, seat_class):
-    all_seat_numbers = set(range(1, flight.available_economy_seats + 1)) if seat_class == 'economy' \
-        else set(range(1, flight.available_business_seats + 1))
+    return SeatInventory.for_flight(flight)[seat_class].free_seats()
 
-    busy_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class)
-    all_busy_seats = set(ticket.seat_number for ticket in busy_tickets)
 
-    return all_seat_numbers - all_busy_seats
+def free_seats_by_class(flight):
+    inventories = SeatInventory.for_flight(flight)
+    return inventories['economy'].free_seats(), inventories['business'].free_seats()
+
+
+def remaining_seats_by_class(flight):
+    """Seats of the flight which can still be booked, read from the inventory counters."""
+    inventories = SeatInventory.for_flight(flight)
+    return inventories['economy'].remaining(), inventories['business'].remaining()
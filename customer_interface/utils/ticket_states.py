@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from customer_interface.models import SeatInventory, Ticket, TicketEvent
+
+# Allowed status changes of a ticket
+TRANSITIONS = {
+    'booked': {'available', 'checked_out'},  # Hold expired / order paid
+    'available': {'booked', 'checked_out'},  # Claimed by another buyer / order paid after the hold expired
+    'checked_out': set(),
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def transition_many(ticket_ids, from_state, to_state, actor=None, **values):
+    """
+    Moves the tickets from from_state to to_state with one guarded UPDATE and logs a TicketEvent for each of them.
+    No per-instance signals are sent; the seat inventory counters are moved in the same transaction.
+
+    Args:
+        ticket_ids: ids of the tickets, a list or a values('id') queryset.
+        from_state (str or tuple): the status (or statuses) the tickets must be in, other tickets are skipped.
+        to_state (str): the new status.
+        actor: the user who made the change, None for the system.
+        **values: other columns updated together with the status.
+
+    Returns:
+        list: ids of the tickets which were moved.
+    """
+    from_states = (from_state,) if isinstance(from_state, str) else tuple(from_state)
+    for state in from_states:
+        if to_state not in TRANSITIONS[state]:
+            raise InvalidTransition(f'A ticket can not go from {state} to {to_state}')
+
+    with transaction.atomic(savepoint=False):
+        moved = SeatInventory.update_tickets(
+            Ticket.objects.filter(id__in=ticket_ids, status__in=from_states), status=to_state, **values
+        )
+        TicketEvent.objects.bulk_create([
+            TicketEvent(ticket_id=ticket_id, from_state=previous, to_state=to_state, actor=actor)
+            for ticket_id, previous in moved
+        ])
+    return [ticket_id for ticket_id, _previous in moved]
+
+
+def transition_one(row, to_state, actor=None, **values):
+    """
+    Moves one ticket read without a lock to to_state with a single conditional UPDATE and logs its TicketEvent.
+    The whole row is the guard of the UPDATE (see SeatInventory.update_ticket), so there is no locking read.
+
+    Args:
+        row: the SeatInventory.TICKET_STATE columns of the ticket.
+        to_state (str): the new status.
+        actor: the user who made the change, None for the system.
+        **values: other columns updated together with the status.
+
+    Returns:
+        bool: whether the ticket was moved, False if it changed since it was read.
+    """
+    from_state = row[SeatInventory.TICKET_STATE.index('status')]
+    if to_state not in TRANSITIONS[from_state]:
+        raise InvalidTransition(f'A ticket can not go from {from_state} to {to_state}')
+
+    with transaction.atomic(savepoint=False):
+        if not SeatInventory.update_ticket(row, status=to_state, **values):
+            return False
+        TicketEvent.objects.create(ticket_id=row[0], from_state=from_state, to_state=to_state, actor=actor)
+    return True
@@ -1,13 +1,21 @@
 import base64
 import time
+import threading
 import requests
 import hashlib
 import hmac
 
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 SECRET_KEY = 'flk3409refn54t54t*FNJRET'
 domain_name = '34.70.195.173'
 merchantAccount = 'test_merch_n1'
-WAYFORPAY_API = "https://api.wayforpay.com/api"
+
+# One session per process: its connection pool is shared by all threads, the reconcile workers included
+_session = None
+_session_lock = threading.Lock()
 
 
 def generate_hmac(data, secret_key):
@@ -76,9 +84,73 @@ def create_request_params(price, email, ticket_count, order_id):
     return params
 
 
+def create_check_status_params(order_id):
+    orderReference = encode_order_reference(order_id)
+    params = {
+        "transactionType": "CHECK_STATUS",
+        "merchantAccount": merchantAccount,
+        "orderReference": orderReference,
+        "apiVersion": 1,
+    }
+    params["merchantSignature"] = generate_hmac([params["merchantAccount"], params["orderReference"]], SECRET_KEY)
+    return params
+
+
+def create_session():
+    """
+    Creates a session with a pool of up to WAYFORPAY_POOL_SIZE connections to the gateway.
+    Connection errors, read timeouts and 502/503/504 answers are retried with exponential backoff and jitter.
+    allowed_methods=None makes urllib3 retry POST too, although it is not idempotent in HTTP terms, even
+    when the request may already have reached the gateway. Both requests sent here can be repeated:
+    CREATE_INVOICE is identified by its orderReference, so a second one does not create another invoice,
+    and CHECK_STATUS only reads.
+    """
+    retry = Retry(
+        total=settings.WAYFORPAY_RETRIES,
+        backoff_factor=0.5,
+        backoff_jitter=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.WAYFORPAY_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns the session of the process, creating it on first use. It is shared by the threads, so
+    WAYFORPAY_POOL_SIZE bounds the connections of the whole process. The urllib3 pool is thread-safe,
+    and the gateway API sets no cookies which the threads could race on.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def close_session():
+    """Closes the pooled connections; the next request creates a new session."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
 def send_request(params):
-    response = requests.post(WAYFORPAY_API, json=params)
-    return response
+    """
+    Sends the request to the WayForPay API with (connect, read) timeouts.
+
+    Raises:
+        requests.RequestException: when the gateway is unreachable or does not answer in time.
+    """
+    return get_session().post(settings.WAYFORPAY_API, json=params, timeout=settings.WAYFORPAY_TIMEOUT)
 
 
 def handle_response(response):
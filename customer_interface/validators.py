@@ -1,77 +1,80 @@
 from django.core.exceptions import ValidationError
 
+BUSY_STATUSES = ('booked', 'checked_out')
 
-def create_ticket_validator(seat_class, seat_number, flight, Ticket):
-    if seat_class == 'economy':
-        total_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class,
-                                              status__in=['booked', 'checked_out']).count()
-        all_economy_seat = set(range(1, flight.available_economy_seats + 1))
-        if total_tickets >= flight.available_economy_seats:
-            raise ValidationError('This flight full')
-        if seat_number is not None:
-            try:
-                seat_number = int(seat_number)
-            except ValueError:
-                raise ValidationError('Not a valid seat number')
-
-            if seat_number not in all_economy_seat:
-                raise ValidationError('Not a valid seat number')
-        busy_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class)
-        all_busy_seats = set(ticket.seat_number for ticket in busy_tickets)
-        if seat_number is not None:
-            if seat_number in all_busy_seats:
-                raise ValidationError('this seat is busy')
-
-    if seat_class == 'business':
-        total_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class,
-                                              status__in=['booked', 'checked_out']).count()
-        all_business_seat = set(range(1, flight.available_business_seats + 1))
-        if total_tickets >= flight.available_business_seats:
+
+class SeatSnapshot:
+    """
+    Seats of one class on a flight, loaded with a single query.
+    The snapshot answers capacity, range and busy seat checks for any number of tickets.
+    """
+
+    def __init__(self, flight, seat_class, Ticket):
+        self.capacity = flight.available_economy_seats if seat_class == 'economy' else flight.available_business_seats
+        self.sold = 0
+        self.busy_seats = {}
+        rows = Ticket.objects.filter(flight=flight, seat_class=seat_class).values_list('id', 'seat_number', 'status')
+        for ticket_id, seat_number, status in rows:
+            if status in BUSY_STATUSES:
+                self.sold += 1
+            if seat_number is not None:
+                self.busy_seats[seat_number] = ticket_id
+
+    def check_capacity(self):
+        if self.sold >= self.capacity:
             raise ValidationError('This flight full')
-        if seat_number is not None:
-            try:
-                seat_number = int(seat_number)
-            except ValueError:
-                raise ValidationError('Not a valid seat number')
-
-            if seat_number not in all_business_seat:
-                raise ValidationError('Not a valid seat number')
-        busy_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class)
-        all_busy_seats = set(ticket.seat_number for ticket in busy_tickets)
-        if seat_number is not None:
-            if seat_number in all_busy_seats:
-                raise ValidationError('this seat is busy')
 
+    def check_seat(self, seat_number, ticket_id=None):
+        """Validates the seat number and returns it as int (or None when no seat is selected)."""
+        if seat_number is None:
+            return None
+        try:
+            seat_number = int(seat_number)
+        except ValueError:
+            raise ValidationError('Not a valid seat number')
 
-def update_ticket_validator(seat_class, seat_number, flight, Ticket):
-    if seat_class == 'economy':
-        all_economy_seat = set(range(1, flight.available_economy_seats + 1))
-        if seat_number is not None:
-            try:
-                seat_number = int(seat_number)
-            except ValueError:
-                raise ValidationError('Not a valid seat number')
-
-            if seat_number not in all_economy_seat:
-                raise ValidationError('Not a valid seat number')
-        busy_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class)
-        all_busy_seats = set(ticket.seat_number for ticket in busy_tickets)
-        if seat_number is not None:
-            if seat_number in all_busy_seats:
-                raise ValidationError('this seat is busy')
+        if not 1 <= seat_number <= self.capacity:
+            raise ValidationError('Not a valid seat number')
+        if seat_number in self.busy_seats and self.busy_seats[seat_number] != ticket_id:
+            raise ValidationError('this seat is busy')
+        return seat_number
 
-    if seat_class == 'business':
-        all_business_seat = set(range(1, flight.available_business_seats + 1))
+    def take_seat(self, seat_number, ticket_id):
         if seat_number is not None:
-            try:
-                seat_number = int(seat_number)
-            except ValueError:
-                raise ValidationError('Not a valid seat number')
-
-            if seat_number not in all_business_seat:
-                raise ValidationError('Not a valid seat number')
-        busy_tickets = Ticket.objects.filter(flight=flight, seat_class=seat_class)
-        all_busy_seats = set(ticket.seat_number for ticket in busy_tickets)
-        if seat_number is not None:
-            if seat_number in all_busy_seats:
-                raise ValidationError('this seat is busy')
+            self.busy_seats[seat_number] = ticket_id
+
+
+def create_ticket_validator(seat_class, seat_number, flight, Ticket):
+    snapshot = SeatSnapshot(flight, seat_class, Ticket)
+    snapshot.check_capacity()
+    snapshot.check_seat(seat_number)
+
+
+def update_ticket_validator(seat_class, seat_number, flight, Ticket, ticket_id=None):
+    snapshot = SeatSnapshot(flight, seat_class, Ticket)
+    return snapshot.check_seat(seat_number, ticket_id)
+
+
+def validate_ticket_seats(tickets_seats, Ticket):
+    """
+    Validates the seats requested for several tickets (e.g. all tickets of one order).
+
+    Args:
+        tickets_seats: list of (ticket, seat_number) pairs, seat_number may be None.
+        Ticket: the Ticket model.
+
+    Returns:
+        list: validated seat numbers as int or None, in the order of tickets_seats.
+    """
+    snapshots = {}
+    seat_numbers = []
+    for ticket, seat_number in tickets_seats:
+        key = (ticket.flight_id, ticket.seat_class)
+        if key not in snapshots:
+            snapshots[key] = SeatSnapshot(ticket.flight, ticket.seat_class, Ticket)
+        snapshot = snapshots[key]
+        seat_number = snapshot.check_seat(seat_number, ticket.pk)
+        # Two tickets of the same batch can not take the same seat either
+        snapshot.take_seat(seat_number, ticket.pk)
+        seat_numbers.append(seat_number)
+    return seat_numbers
@@ -1,32 +1,50 @@
-import json
-import time
+import hmac
+import logging
 
-from datetime import datetime
 from functools import wraps
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
-from django.contrib.auth.decorators import permission_required
+from django.contrib.auth.decorators import permission_required, login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.models import Group
-from django.core.exceptions import ValidationError
-from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.core.exceptions import ValidationError, PermissionDenied
+from django.db import transaction, IntegrityError
+from django.db.models import Sum, Prefetch
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect, Http404, FileResponse, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
+from django.utils import timezone
 from django.views import generic, View
 
+import requests
+
+from rest_framework.permissions import BasePermission
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .decorators import process_exception
 from .forms import TicketForm, TicketSelectionForm, SearchFlightForm, CreateFlight, FlightFacilitiesFormSet, \
     SearchUserForm
-from .models import Ticket, Order, Basket, TicketFacilities, FlightFacilities, Flight, FacilitiesOrder
+from .models import Ticket, Order, Basket, BasketNotification, TicketFacilities, FlightFacilities, Flight, \
+    FacilitiesOrder, SeatInventory
+from .serializers import BoardingSerializer
 from .tasks import send_tickets
-from .utils.ticket_seats import free_seats
-from .utils.wayforpay import create_request_params, send_request, handle_response, generate_response_signature, \
-    SECRET_KEY, decode_order_reference, generate_hmac
-from .validators import update_ticket_validator, create_ticket_validator
+from .utils.boarding import board_tickets, BOARDED, RESULT_MESSAGES
+from .utils.booking import book_ticket
+from .utils.cache import cached_flight, cached_facilities_for_flight, cached_free_seats
+from .utils.flight_search import search_flights, keyset_page
+from .utils.payments import parse_callback, is_approved, mark_order_paid, accept_response
+from .utils.price_quote import price_quotes
+from .utils.query_metrics import query_metrics
+from .utils.ticket_artifacts import open_ticket_pdf
+from .utils.ticket_codes import read_ticket_code
+from .utils.ticket_seats import free_seats_by_class, remaining_seats_by_class
+from .utils.wayforpay import create_request_params, send_request, handle_response, decode_order_reference
+from .validators import update_ticket_validator, validate_ticket_seats
+
+logger = logging.getLogger(__name__)
 
 
 class IndexView(LoginRequiredMixin, generic.ListView):
@@ -37,6 +55,8 @@ class IndexView(LoginRequiredMixin, generic.ListView):
     template_name = "base_user_interface.html"
     login_url = reverse_lazy('users:login')
 
+    page_size = 20
+
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data()
         user = self.request.user
@@ -47,51 +67,40 @@ class IndexView(LoginRequiredMixin, generic.ListView):
         context["place_of_departure"] = place_of_departure
         context["place_of_arrival"] = place_of_arrival
         context['basket_items_count'] = basket_items_count
-        context['search_form'] = SearchFlightForm(
-            initial={
-                "place_of_departure": place_of_departure,
-                "place_of_arrival": place_of_arrival,
-            }
-        )
+        context['search_form'] = self.search_form
+
+        if self.next_cursor:
+            query = self.request.GET.copy()
+            query['after'] = self.next_cursor
+            context['next_page_query'] = query.urlencode()
 
+        # Counters come from the annotations added in get_queryset, so no extra queries are made per flight
         flight_tickets = {}
         check_in_tickets = {}
         gate_tickets = {}
         for flight in context['object_list']:
-            tickets_count = Ticket.objects.filter(flight=flight, status='checked_out').count()
-            tickets_check_in = Ticket.objects.filter(flight=flight, status='checked_out',
-                                                     check_in_manager__isnull=False).count()
-            tickets_gate = Ticket.objects.filter(flight=flight, status='checked_out',
-                                                 gate_manager__isnull=False).count()
-            flight_tickets[flight.pk] = tickets_count
-            check_in_tickets[flight.pk] = tickets_check_in
-            gate_tickets[flight.pk] = tickets_gate
+            flight_tickets[flight.pk] = flight.tickets_count
+            check_in_tickets[flight.pk] = flight.tickets_check_in
+            gate_tickets[flight.pk] = flight.tickets_gate
         context['flight_tickets'] = flight_tickets
         context['check_in_tickets'] = check_in_tickets
         context['gate_tickets'] = gate_tickets
         return context
 
     def get_queryset(self):
-        place_of_departure = self.request.GET.get("place_of_departure")
-        place_of_arrival = self.request.GET.get("place_of_arrival")
-
-        queryset = super().get_queryset()
-
-        if place_of_departure and place_of_arrival:
-            queryset = queryset.filter(
-                place_of_departure__icontains=place_of_departure,
-                place_of_arrival__icontains=place_of_arrival,
-            )
-        if place_of_departure:
-            queryset = queryset.filter(
-                place_of_departure__icontains=place_of_departure,
-            )
-        if place_of_arrival:
-            queryset = queryset.filter(
-                place_of_arrival__icontains=place_of_arrival,
-            )
+        self.search_form = SearchFlightForm(self.request.GET)
+        filters = self.search_form.cleaned_data if self.search_form.is_valid() else {}
+
+        # The counters are summed over the two seat inventories of a flight instead of counting its tickets
+        queryset = super().get_queryset().annotate(
+            tickets_count=Coalesce(Sum('seat_inventories__sold'), 0),
+            tickets_check_in=Coalesce(Sum('seat_inventories__checked_in'), 0),
+            tickets_gate=Coalesce(Sum('seat_inventories__boarded'), 0),
+        )
+        queryset = search_flights(queryset, **filters)
 
-        return queryset
+        flights, self.next_cursor = keyset_page(queryset, self.request.GET.get("after"), self.page_size)
+        return flights
 
 
 class FlightDetailView(generic.DetailView):
@@ -101,6 +110,12 @@ class FlightDetailView(generic.DetailView):
     model = Flight
     template_name = 'customer_interface/flight_detail.html'
 
+    def get_object(self, queryset=None):
+        try:
+            return cached_flight(self.kwargs['pk'])
+        except Flight.DoesNotExist:
+            raise Http404('No flight found matching the query')
+
     def post(self, request, *args, **kwargs):
         flight = self.get_object()
         user = request.user
@@ -111,39 +126,14 @@ class FlightDetailView(generic.DetailView):
         else:
             seat_class = 'business'
 
-        ticket = Ticket(flight=flight, seat_class=seat_class)
         try:
-            create_ticket_validator(ticket.seat_class, ticket.seat_number, ticket.flight, Ticket)
-            available_tickets = Ticket.objects.filter(
-                flight=ticket.flight,
-                status='available',
-                seat_class=seat_class
-            )
-
-            if available_tickets.exists():
-                available_ticket = available_tickets.first()
-                basket_overdue = Basket.objects.filter(tickets=available_ticket).first()
-                basket_overdue.messages += f'\nDue to the fact that you did not buy the ticket within 30 minutes and it was bought by another user we have removed Flight: {available_ticket.flight} Seat: {available_ticket.seat_class} from your cart.'
-                basket_overdue.save()
-                available_ticket.delete()
-
-            ticket.save()
-            basket.tickets.add(ticket)
+            book_ticket(flight.pk, seat_class, basket)
 
         except ValidationError as e:
             error_message = str(e)
-            available_economy_seats = flight.available_economy_seats
-            available_business_seats = flight.available_business_seats
-            total_economy_tickets = Ticket.objects.filter(flight=flight, seat_class='economy',
-                                                          status__in=['booked', 'checked_out']).count()
-            total_business_tickets = Ticket.objects.filter(flight=flight, seat_class='business',
-                                                           status__in=['booked', 'checked_out']).count()
-            available_economy_seats -= total_economy_tickets
-            available_business_seats -= total_business_tickets
-
-            free_economy_seats = free_seats(flight, seat_class='economy')
-            free_business_seats = free_seats(flight,
-                                             seat_class='business')  # This function returns the set of free spaces in the class
+            available_economy_seats, available_business_seats = remaining_seats_by_class(flight)
+
+            free_economy_seats, free_business_seats = cached_free_seats(flight)
 
             return render(request, self.template_name, {
                 'flight': flight,
@@ -158,22 +148,13 @@ class FlightDetailView(generic.DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        flight = self.get_object()
+        flight = self.object
         user = self.request.user
         basket = Basket.objects.get(user=user)
         basket_items_count = basket.tickets.count()
-        available_economy_seats = flight.available_economy_seats
-        available_business_seats = flight.available_business_seats
-        total_economy_tickets = Ticket.objects.filter(flight=flight, seat_class='economy',
-                                                      status__in=['booked', 'checked_out']).count()
-        total_business_tickets = Ticket.objects.filter(flight=flight, seat_class='business',
-                                                       status__in=['booked', 'checked_out']).count()
-        available_economy_seats -= total_economy_tickets
-        available_business_seats -= total_business_tickets
-
-        free_economy_seats = free_seats(flight, seat_class='economy')
-        free_business_seats = free_seats(flight,
-                                         seat_class='business')  # This function returns the set of free spaces in the class
+        available_economy_seats, available_business_seats = remaining_seats_by_class(flight)
+
+        free_economy_seats, free_business_seats = cached_free_seats(flight)
 
         context['free_economy_seats'] = free_economy_seats
         context['free_business_seats'] = free_business_seats
@@ -189,38 +170,20 @@ def basket_view(request):
     """
     user = request.user
     basket = Basket.objects.get(user=user)
-    tickets = basket.tickets.all()
+    tickets = basket.tickets.select_related('flight')
 
     if request.method == 'POST':
         if 'add_ticket' in request.POST:
             ticket_form = TicketForm(request.POST)
             if ticket_form.is_valid():
                 ticket = ticket_form.save(commit=False)
-                create_ticket_validator(ticket.seat_class, ticket.seat_number, ticket.flight, Ticket)
-                if ticket.seat_class == 'economy':
-                    # Check if there are already available tickets for this flight
-                    available_tickets = Ticket.objects.filter(
-                        flight=ticket.flight,
-                        status='available',
-                        seat_class='economy'
-                    )
-                else:
-                    available_tickets = Ticket.objects.filter(
-                        flight=ticket.flight,
-                        status='available',
-                        seat_class='business')
-
-                if available_tickets.exists():
-                    # If there are available tickets, delete one of them
-                    available_ticket = available_tickets.first()
-                    basket_overdue = Basket.objects.filter(tickets=available_ticket).first()
-                    basket_overdue.messages += f'\nDue to the fact that you did not buy the ticket within 30 minutes and it was bought by another user we have removed Flight: {available_ticket.flight} Seat: {available_ticket.seat_class} from your cart.'
-                    basket_overdue.save()
-                    available_ticket.delete()
-
-                ticket.save()
-                basket.tickets.add(ticket)
-                return redirect('customer_interface:basket')
+                try:
+                    book_ticket(ticket.flight_id, ticket.seat_class, basket)
+                    return redirect('customer_interface:basket')
+                except ValidationError as e:
+                    ticket_form.add_error(None, e)
+                    return render(request, 'customer_interface/basket.html',
+                                  {'tickets': tickets, 'ticket_form': ticket_form})
             else:
                 return render(request, 'customer_interface/basket.html',
                               {'tickets': tickets, 'ticket_form': ticket_form})
@@ -234,14 +197,25 @@ def basket_view(request):
         if 'next' in request.POST:
             return redirect('customer_interface:create_order')
 
-    basket_messages = basket.messages.split("\n") if basket.messages else []
-    basket.messages = ""
-    basket.save()
+    # Only the shown notifications are deleted, one added meanwhile is shown on the next visit
+    notifications = list(basket.notifications.values_list('id', 'message'))
+    basket_messages = [message for _id, message in notifications]
+    if notifications:
+        BasketNotification.objects.filter(
+            id__in=[notification_id for notification_id, _message in notifications]
+        ).delete()
 
     ticket_form = TicketForm()
 
+    # Prices come from the quote cache, the flight price columns are not read again
+    total_price = 0
+    for ticket in tickets:
+        ticket.price = price_quotes.get(ticket.flight_id, ticket.seat_class)
+        total_price += ticket.price
+
     return render(request, 'customer_interface/basket.html',
-                  {'tickets': tickets, 'ticket_form': ticket_form, 'basket_messages': basket_messages})
+                  {'tickets': tickets, 'ticket_form': ticket_form, 'basket_messages': basket_messages,
+                   'total_price': total_price})
 
 
 def delete_ticket(request, ticket_id):
@@ -308,44 +282,53 @@ def ticket_customization(request, order_id):
         View for customizing tickets before finalizing the order.
     """
     order = Order.objects.get(id=order_id)  # Receiving the order
-    order_tickets = order.tickets.all()  # Here I use related_name (tickets) to get all tickets associated with the order.
+    order_tickets = order.tickets.select_related('flight')  # Here I use related_name (tickets) to get all tickets associated with the order.
 
     if request.method == 'POST':
-        with transaction.atomic():  # Creating a transaction
-            for ticket in order_tickets:
-                facilities_ids = request.POST.getlist(f'facilities_{ticket.id}')
-                # Add new links for the selected amenities
-                for facility_id in facilities_ids:
-                    TicketFacilities.objects.create(
-                        ticket=ticket,
-                        flight_facilities=FlightFacilities.objects.get(id=facility_id),
-                    )
-
-                seat_number = request.POST.get(f'seat_number_{ticket.id}', None)
-                if seat_number == '':
-                    seat_number = None
-                update_ticket_validator(ticket.seat_class, seat_number, ticket.flight, Ticket)
-                ticket.seat_number = seat_number
-                first_name = request.POST.get(f'first_name_{ticket.id}')
-                last_name = request.POST.get(f'last_name_{ticket.id}')
-                ticket.first_name = first_name
-                ticket.last_name = last_name
-                ticket.save()
-
-                if ticket.seat_class == 'economy':
-                    order.price += ticket.flight.price_economy_seats
-                    if ticket.seat_number:
-                        order.price += ticket.flight.price_number_economy_seats
-                else:
-                    order.price += ticket.flight.price_business_seats
-                    if ticket.seat_number:
-                        order.price += ticket.flight.price_number_business_seats
-
-                if ticket.flight_facilities.exists():
-                    for ticket_facility in ticket.ticketfacilities_set.all():
-                        order.price += ticket_facility.flight_facilities.price
+        order_tickets = list(order_tickets.prefetch_related('ticketfacilities_set'))
+        selected_facilities = {ticket.id: request.POST.getlist(f'facilities_{ticket.id}') for ticket in order_tickets}
+        # All selected facilities of the order are loaded with one query
+        try:
+            facilities = FlightFacilities.objects.in_bulk(
+                {int(facility_id) for facilities_ids in selected_facilities.values() for facility_id in facilities_ids}
+            )
+        except ValueError:
+            raise ValidationError('Not a valid facility')
 
-                order.save()
+        try:
+            with transaction.atomic():  # Creating a transaction
+                # All requested seats are validated against one snapshot per flight and class
+                seat_numbers = validate_ticket_seats(
+                    [(ticket, request.POST.get(f'seat_number_{ticket.id}') or None) for ticket in order_tickets],
+                    Ticket,
+                )
+                new_ticket_facilities = []
+                for ticket, seat_number in zip(order_tickets, seat_numbers):
+                    ticket.seat_number = seat_number
+                    ticket.first_name = request.POST.get(f'first_name_{ticket.id}')
+                    ticket.last_name = request.POST.get(f'last_name_{ticket.id}')
+
+                    facility_ids = [ticket_facility.flight_facilities_id
+                                    for ticket_facility in ticket.ticketfacilities_set.all()]
+                    # Add new links for the selected amenities
+                    for facility_id in selected_facilities[ticket.id]:
+                        facility = facilities.get(int(facility_id))
+                        if facility is None or facility.flight_id != ticket.flight_id:
+                            raise ValidationError('Not a valid facility')
+                        new_ticket_facilities.append(TicketFacilities(ticket=ticket, flight_facilities=facility))
+                        facility_ids.append(facility.id)
+
+                    order.price += price_quotes.get(ticket.flight_id, ticket.seat_class,
+                                                    ticket.seat_number is not None, facility_ids)
+
+                TicketFacilities.objects.bulk_create(new_ticket_facilities)
+                Ticket.objects.bulk_update(order_tickets, ['seat_number', 'first_name', 'last_name'])
+                # bulk_update does not send post_save, so the seat bitmaps are updated explicitly
+                SeatInventory.sync_tickets(order_tickets)
+                order.save(update_fields=['price'])
+        except IntegrityError:
+            # Another buyer took one of the selected seats after the validation
+            raise ValidationError('this seat is busy')
 
         return redirect('customer_interface:buy_order', order_id=order_id)
 
@@ -356,13 +339,16 @@ def ticket_customization(request, order_id):
     free_economy_seats = {}
     free_business_seats = {}
     for flight in unique_flights:
-        free_economy_seats = free_seats(flight, seat_class='economy')
-        free_business_seats = free_seats(flight, seat_class='business')
+        free_economy_seats, free_business_seats = free_seats_by_class(flight)
+
+    # Facilities of all flights of the order are loaded with one query
+    flight_facilities = {}
+    for facility in FlightFacilities.objects.filter(flight__in=unique_flights).select_related('facilities'):
+        flight_facilities.setdefault(facility.flight_id, []).append(facility)
 
     ticket_info = []
     for ticket in order_tickets:
-        flight_facilities = FlightFacilities.objects.filter(flight=ticket.flight)
-        ticket_info.append({'ticket': ticket, 'facilities': flight_facilities})
+        ticket_info.append({'ticket': ticket, 'facilities': flight_facilities.get(ticket.flight_id, [])})
 
     return render(request, 'customer_interface/ticket_customization.html', {
         'order_id': order_id,
@@ -372,19 +358,24 @@ def ticket_customization(request, order_id):
     })
 
 
-@transaction.atomic
 def buy_order(request, order_id):
     """
         View for finalizing and purchasing an order.
+        The gateway is called outside of any transaction, so a slow answer holds no database locks.
     """
-    order = Order.objects.get(id=order_id)
+    order = Order.objects.select_related('user').get(id=order_id)
     order_tickets = order.tickets.all()
 
     if request.method == 'POST':
         request_params = create_request_params(order.price, order.user.email, order_tickets.count(), order_id)
-        response = send_request(request_params)
+        try:
+            response = send_request(request_params)
+        except requests.RequestException:
+            logger.warning('WayForPay invoice for order %s failed', order_id, exc_info=True)
+            messages.error(request, 'Payment service is unavailable, please try again later')
+            return redirect('customer_interface:buy_order', order_id=order_id)
         result = handle_response(response)
-        print(result)
+        logger.info('WayForPay invoice for order %s: %s', order_id, result)
 
         return redirect('customer_interface:basket')
 
@@ -400,48 +391,18 @@ class WayForPayCallback(APIView):
     """
 
     def post(self, request):
-        print(request.data)
-        data_string = list(request.data.keys())[0]
-        data_dict = json.loads(data_string)
-
-        # Доступ к параметру orderReference
-        orderReference = data_dict.get("orderReference")
-        code = data_dict.get("reasonCode")
-        time_now = int(time.time())
-        print(time_now)
-        print(code)
-        print(data_dict)
-        print(orderReference)
-        order_id = decode_order_reference(orderReference)
-        print(order_id)
-
-        if code == 1100:
-            order = Order.objects.get(id=order_id)
-            order_tickets = order.tickets.all()
-
-            for ticket in order_tickets:
-                ticket.status = 'checked_out'
-                ticket.save()
+        try:
+            data = parse_callback(request)
+            order_reference = data["orderReference"]
+            decode_order_reference(order_reference)
+        except ValueError:
+            return Response({"error": "invalid callback"}, status=400)
 
-                send_tickets.apply_async(args=[ticket.id, ticket.order.user.email])
+        if is_approved(data):
+            mark_order_paid(order_reference)
 
         # Отправить ответ WayForPay о принятии заказа
-        response_data = {
-            "orderReference": orderReference,
-            "status": "accept",
-            "time": time_now,
-        }
-
-        data_to_sign = [
-            response_data["orderReference"],
-            response_data["status"],
-            str(response_data["time"]),
-        ]
-        print(response_data)
-        response_data["signature"] = generate_hmac(data_to_sign, SECRET_KEY)
-        print(response_data)
-
-        return Response(response_data)
+        return Response(accept_response(order_reference))
 
 
 @permission_required(perm='customer_interface.view_ticket', raise_exception=True)
@@ -450,61 +411,69 @@ def ticket_input(request):
         View for inputting ticket information.
     """
     if request.method == 'POST':
-        ticket_id = request.POST.get('ticket_id')
-        return redirect('customer_interface:ticket_detail', ticket_id=ticket_id)
+        # A scanned QR payload or a typed ticket id
+        try:
+            code = read_ticket_code(request.POST.get('ticket_id'))
+        except ValueError as e:
+            return render(request, 'customer_interface/ticket_input.html', {'error_message': str(e)})
+        return redirect('customer_interface:ticket_detail', ticket_id=code.ticket_id)
     return render(request, 'customer_interface/ticket_input.html')
 
 
+def ticket_detail_context(ticket):
+    """Context of the ticket detail page, built from the prefetched ticket and one seat inventory read."""
+    context = {
+        'ticket': ticket,
+        'flight_facilities': cached_facilities_for_flight(ticket.flight_id),
+        'ticket_facility_ids': [ticket_facility.flight_facilities_id
+                                for ticket_facility in ticket.ticketfacilities_set.all()],
+    }
+    # The free seats are only offered to a ticket without a seat
+    if ticket.seat_number is None:
+        context['free_economy_seats'], context['free_business_seats'] = free_seats_by_class(ticket.flight)
+    return context
+
+
 @permission_required(perm='customer_interface.view_ticket', raise_exception=True)
 def ticket_detail(request, ticket_id):
     """
         View for displaying detailed information about a ticket.
     """
     user = request.user
-    ticket = Ticket.objects.get(id=ticket_id)
-    flight = ticket.flight
-    facilities_price = 0
+    ticket = get_object_or_404(
+        Ticket.objects.select_related('flight', 'order').prefetch_related(
+            Prefetch('ticketfacilities_set',
+                     queryset=TicketFacilities.objects.select_related('flight_facilities__facilities'))),
+        id=ticket_id,
+    )
 
     if request.method == 'POST':
         ticket.check_in_manager = user
-        ticket.time_check = datetime.now()
+        ticket.time_check = timezone.now()
 
         try:
             with transaction.atomic():
                 facilities_ids = request.POST.getlist(f'facilities_{ticket.id}')
                 # Добавляем новые связи только для выбранных удобств
                 for facility_id in facilities_ids:
-                    facilities = TicketFacilities.objects.create(
+                    TicketFacilities.objects.create(
                         ticket=ticket,
                         flight_facilities=FlightFacilities.objects.get(id=facility_id),
                     )
-                    facilities_price += facilities.flight_facilities.price
 
                 seat_number = request.POST.get('seat_number')
                 if seat_number:
-                    update_ticket_validator(ticket.seat_class, seat_number, ticket.flight, Ticket)
+                    seat_number = update_ticket_validator(ticket.seat_class, seat_number, ticket.flight, Ticket,
+                                                          ticket.pk)
                     ticket.seat_number = seat_number
-                    if ticket.seat_class == 'economy':
-                        facilities_price += ticket.flight.price_number_economy_seats
-                    else:
-                        facilities_price += ticket.flight.price_number_business_seats
 
+                facilities_price = price_quotes.surcharge(ticket.flight_id, ticket.seat_class, bool(seat_number),
+                                                          facilities_ids)
                 ticket.save()
         except ValidationError as e:
-            error_message = str(e)
-
-            flight_facilities = FlightFacilities.objects.filter(flight=ticket.flight)
-
-            free_economy_seats = free_seats(flight, seat_class='economy')
-            free_business_seats = free_seats(flight, seat_class='business')
-
-            return render(request, 'customer_interface/ticket_detail.html', {
-                'ticket': ticket,
-                'flight_facilities': flight_facilities,
-                'free_economy_seats': free_economy_seats,
-                'free_business_seats': free_business_seats,
-                'error_message': error_message,
-            })
+            context = ticket_detail_context(ticket)
+            context['error_message'] = str(e)
+            return render(request, 'customer_interface/ticket_detail.html', context)
 
         if facilities_price:
             FacilitiesOrder.objects.create(
@@ -516,19 +485,23 @@ def ticket_detail(request, ticket_id):
 
         return redirect('customer_interface:ticket_input')
 
-    flight_facilities = FlightFacilities.objects.filter(flight=ticket.flight)
-    ticket_facility_ids = ticket.flight_facilities.values_list('id', flat=True)
+    return render(request, 'customer_interface/ticket_detail.html', ticket_detail_context(ticket))
 
-    free_economy_seats = free_seats(flight, seat_class='economy')
-    free_business_seats = free_seats(flight, seat_class='business')
 
-    return render(request, 'customer_interface/ticket_detail.html', {
-        'ticket': ticket,
-        'flight_facilities': flight_facilities,
-        'ticket_facility_ids': ticket_facility_ids,
-        'free_economy_seats': free_economy_seats,
-        'free_business_seats': free_business_seats,
-    })
+@login_required
+def ticket_pdf(request, ticket_id):
+    """
+        View for downloading the PDF of a ticket, streamed from the ticket artifact cache.
+    """
+    ticket = get_object_or_404(
+        Ticket.objects.select_related('flight', 'order').prefetch_related('flight_facilities__facilities'),
+        id=ticket_id,
+    )
+    is_owner = ticket.order is not None and ticket.order.user_id == request.user.id and ticket.status == 'checked_out'
+    if not is_owner and not request.user.has_perm('customer_interface.view_ticket'):
+        raise PermissionDenied
+    return FileResponse(open_ticket_pdf(ticket), as_attachment=True, filename=f'ticket_{ticket.id}.pdf',
+                        content_type='application/pdf')
 
 
 @permission_required(perm='customer_interface.add_ticket', raise_exception=True)
@@ -537,14 +510,42 @@ def ticket_gate(request):
     View for managing gate access for tickets.
     """
 
-    user = request.user
+    context = {}
     if request.method == 'POST':
-        ticket_id = request.POST.get('ticket_id')
-        ticket = Ticket.objects.get(id=ticket_id)
-        ticket.gate_manager = user
-        ticket.time_gate = datetime.now()
-        ticket.save()
-    return render(request, 'customer_interface/ticket_gate.html')
+        # The signed code tells the flight; typed ids are left to the check-in desk
+        raw_code = request.POST.get('ticket_id')
+        try:
+            code = read_ticket_code(raw_code, typed_ids=False)
+        except ValueError as e:
+            return render(request, 'customer_interface/ticket_gate.html', {'error_message': str(e)})
+        flight = get_object_or_404(Flight, id=code.flight_id)
+        # The same checks and counters as the bulk boarding API
+        result = board_tickets(flight, [raw_code], request.user)['results'][0]['result']
+        if result == BOARDED:
+            context['success_message'] = f'Ticket {code.ticket_id} boarded'
+        else:
+            context['error_message'] = RESULT_MESSAGES[result]
+    return render(request, 'customer_interface/ticket_gate.html', context)
+
+
+class CanBoardTickets(BasePermission):
+    """The permission of the ticket_gate page."""
+
+    def has_permission(self, request, view):
+        return request.user.has_perm('customer_interface.add_ticket')
+
+
+class BoardingView(APIView):
+    """
+        API view for boarding a batch of scanned tickets of a flight at the gate.
+    """
+    permission_classes = [CanBoardTickets]
+
+    def post(self, request, flight_id):
+        flight = get_object_or_404(Flight, pk=flight_id)
+        serializer = BoardingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(board_tickets(flight, serializer.validated_data['tickets'], request.user))
 
 
 class CreateFlightView(PermissionRequiredMixin, LoginRequiredMixin, View):
@@ -667,11 +668,24 @@ def flight_stats(request, pk):
     """
     flight = get_object_or_404(Flight, pk=pk)
     tickets = Ticket.objects.filter(flight=flight)
-    total_economy_tickets = Ticket.objects.filter(flight=flight, seat_class='economy', status='checked_out').count()
-    total_business_tickets = Ticket.objects.filter(flight=flight, seat_class='business', status='checked_out').count()
+    inventories = SeatInventory.for_flight(flight)
+    total_economy_tickets = inventories['economy'].sold
+    total_business_tickets = inventories['business'].sold
     return render(request, 'customer_interface/flight_stats.html', {
         'flight': flight,
         'tickets': tickets,
         'total_economy_tickets': total_economy_tickets,
         'total_business_tickets': total_business_tickets,
     })
+
+
+def metrics(request):
+    """
+        View exporting the request and SQL metrics of this process for Prometheus.
+    """
+    # Constant time comparison, the response time does not tell how much of the token was guessed
+    authorization = request.headers.get('Authorization', '').encode()
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(authorization,
+                                                             f'Bearer {settings.METRICS_TOKEN}'.encode()):
+        raise Http404
+    return HttpResponse(query_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
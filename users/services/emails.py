@@ -4,6 +4,7 @@ from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from customer_interface.utils.mailer import deliver
 from users.utils.token_generators import TokenGenerator
 
 
@@ -24,4 +25,4 @@ def send_registration_email(request, user_instance):
         to=[user_instance.email],
     )
     email.content_subtype = 'html'
-    email.send()
+    deliver([email])